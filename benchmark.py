@@ -0,0 +1,256 @@
+"""
+Headless benchmark for cutting stock policies.
+
+Runs every selected policy over a grid of order sizes and seeds without rendering,
+and reports per-step latency percentiles, episodes per second, trim loss, filled ratio
+and stocks used. Results are written to <output>.csv (one row per episode) and
+<output>.json (configuration, episodes and per policy/order summary), so that runs of
+different versions can be compared.
+
+Example:
+    python benchmark.py --policies greedy ffd sa --orders small medium --seeds 0 1 2 --output results/baseline
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import gymnasium as gym
+import gym_cutting_stock
+import numpy as np
+
+from policy import GreedyPolicy, MaxRectsPolicy, PlanCache, RandomPolicy
+from student_submissions.s2210xxx.policy2210xxx import Policy2312900_2310559_2420003_2312894_2312974
+
+# Policy name -> factory creating a fresh policy for one episode
+POLICIES = {
+    "greedy": GreedyPolicy,
+    "random": RandomPolicy,
+    "maxrects": MaxRectsPolicy,
+    "ffd": lambda: Policy2312900_2310559_2420003_2312894_2312974(policy_id=1),
+    "sa": lambda: Policy2312900_2310559_2420003_2312894_2312974(policy_id=2),
+    "cg": lambda: Policy2312900_2310559_2420003_2312894_2312974(policy_id=3),
+    "ga": lambda: Policy2312900_2310559_2420003_2312894_2312974(policy_id=4),
+}
+
+# Order size -> keyword arguments of the environment
+ORDERS = {
+    "small": {"max_product_type": 5, "max_product_per_type": 5},
+    "medium": {"max_product_type": 10, "max_product_per_type": 10},
+    "large": {"max_product_type": 25, "max_product_per_type": 20},
+}
+
+EPISODE_FIELDS = [
+    "policy", "order", "seed", "completed", "error", "steps", "placed", "wall_time",
+    "latency_p50_ms", "latency_p90_ms", "latency_p99_ms", "latency_max_ms",
+    "filled_ratio", "trim_loss", "stocks_used",
+]
+
+
+def run_episode(env, policy, seed, max_steps, max_stall, profile=False):
+    """
+    Run one episode from env.reset(seed=seed) until the order is finished, max_steps is reached
+    or max_stall steps in a row do not cut anything. Returns a dict with the episode metrics,
+    and the per-phase timings of the policy under "profile" if profile is True.
+    """
+    policy.seed(seed)
+    if profile:
+        policy.enable_profiling()
+    observation, info = env.reset(seed=seed)
+    remaining = sum(int(prod["quantity"]) for prod in observation["products"])
+    latencies = []
+    placed = 0
+    stall = 0
+    completed = False
+    error = ""
+
+    start = time.perf_counter()
+    while len(latencies) < max_steps and stall < max_stall:
+        step_start = time.perf_counter()
+        action = policy.get_action(observation, info)
+        latencies.append(time.perf_counter() - step_start)
+        try:
+            observation, reward, terminated, truncated, info = env.step(action)
+        except Exception as exc:
+            # An invalid action (e.g. position None) ends the episode instead of the benchmark
+            error = f"{type(exc).__name__}: {exc}"
+            break
+
+        left = sum(int(prod["quantity"]) for prod in observation["products"])
+        stall = stall + 1 if left == remaining else 0
+        placed += remaining - left
+        remaining = left
+        if terminated or truncated:
+            completed = terminated
+            break
+    wall_time = time.perf_counter() - start
+    if profile:
+        policy.disable_profiling()
+
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "seed": seed,
+        "completed": completed,
+        "error": error,
+        "steps": len(latencies),
+        "placed": placed,
+        "wall_time": wall_time,
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p90_ms": float(np.percentile(latencies_ms, 90)),
+        "latency_p99_ms": float(np.percentile(latencies_ms, 99)),
+        "latency_max_ms": float(latencies_ms.max()),
+        "filled_ratio": float(info["filled_ratio"]),
+        "trim_loss": float(info["trim_loss"]),
+        "stocks_used": int(sum(np.any(stock >= 0) for stock in observation["stocks"])),
+        "_latencies": latencies,
+        "profile": policy.profile_stats() if profile else {},
+    }
+
+
+def merge_profiles(profiles):
+    # Add up the per-phase timings of several episodes
+    merged = {}
+    for profile in profiles:
+        for phase, stats in profile.items():
+            total = merged.setdefault(phase, {"calls": 0, "total_s": 0.0, "mean_ms": 0.0, "max_ms": 0.0})
+            total["calls"] += stats["calls"]
+            total["total_s"] += stats["total_s"]
+            total["max_ms"] = max(total["max_ms"], stats["max_ms"])
+    for total in merged.values():
+        total["mean_ms"] = total["total_s"] / total["calls"] * 1000 if total["calls"] else 0.0
+    return merged
+
+
+def summarize(episodes):
+    # Aggregate the episodes of one policy and order size
+    latencies_ms = np.array([t for episode in episodes for t in episode["_latencies"]]) * 1000
+    if latencies_ms.size == 0:
+        latencies_ms = np.zeros(1)
+    wall_time = sum(episode["wall_time"] for episode in episodes)
+    return {
+        "episodes": len(episodes),
+        "completed": sum(episode["completed"] for episode in episodes),
+        "episodes_per_sec": len(episodes) / wall_time if wall_time > 0 else float("inf"),
+        "steps_per_sec": sum(episode["steps"] for episode in episodes) / wall_time if wall_time > 0 else float("inf"),
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p90_ms": float(np.percentile(latencies_ms, 90)),
+        "latency_p99_ms": float(np.percentile(latencies_ms, 99)),
+        "latency_max_ms": float(latencies_ms.max()),
+        "filled_ratio": float(np.mean([episode["filled_ratio"] for episode in episodes])),
+        "trim_loss": float(np.mean([episode["trim_loss"] for episode in episodes])),
+        "stocks_used": float(np.mean([episode["stocks_used"] for episode in episodes])),
+        "profile": merge_profiles(episode["profile"] for episode in episodes),
+    }
+
+
+def run_benchmark(policies, orders, seeds, max_steps=2000, max_stall=50, log=print, profile=False, plan_cache=None):
+    """
+    Run every policy on every order size and seed. Returns (episodes, summary) lists of dicts.
+    Policies with a plan_cache attribute share plan_cache if one is given.
+    """
+    episodes, summary = [], []
+    for order in orders:
+        env = gym.make("gym_cutting_stock/CuttingStock-v0", **ORDERS[order])
+        for name in policies:
+            group = []
+            for seed in seeds:
+                policy = POLICIES[name]()
+                if plan_cache is not None and hasattr(policy, "plan_cache"):
+                    policy.plan_cache = plan_cache
+                episode = run_episode(env, policy, seed, max_steps, max_stall, profile)
+                if hasattr(policy, "close"):
+                    policy.close()
+                episode.update({"policy": name, "order": order})
+                group.append(episode)
+                log(
+                    f"{name:>8} {order:>6} seed={seed:<4} steps={episode['steps']:<5} "
+                    f"trim_loss={episode['trim_loss']:.3f} stocks={episode['stocks_used']:<3} "
+                    f"p50={episode['latency_p50_ms']:.2f}ms {episode['error']}"
+                )
+            summary.append({"policy": name, "order": order, **summarize(group)})
+            episodes.extend(group)
+        env.close()
+    return episodes, summary
+
+
+def write_results(output, config, episodes, summary):
+    # <output>.csv has one row per episode, <output>.json has everything
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=EPISODE_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(episodes)
+    with open(output + ".json", "w") as f:
+        json.dump(
+            {
+                "config": config,
+                "summary": summary,
+                "episodes": [{key: episode[key] for key in EPISODE_FIELDS} for episode in episodes],
+            },
+            f,
+            indent=2,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark for cutting stock policies.")
+    parser.add_argument("--policies", nargs="+", choices=list(POLICIES), default=["greedy", "random", "ffd", "sa"])
+    parser.add_argument("--orders", nargs="+", choices=list(ORDERS), default=list(ORDERS))
+    parser.add_argument("--seeds", nargs="+", type=int, default=list(range(5)))
+    parser.add_argument("--max-steps", type=int, default=2000, help="step limit of one episode")
+    parser.add_argument("--max-stall", type=int, default=50, help="stop after this many steps in a row without a cut")
+    parser.add_argument("--output", default="benchmark_results", help="path prefix of the .csv and .json files")
+    parser.add_argument("--label", default="", help="free text stored with the results, e.g. a version name")
+    parser.add_argument("--profile", action="store_true", help="time the phases of each policy (Policy.enable_profiling)")
+    parser.add_argument("--plan-cache", default=None, help="JSON file of cutting plans shared by the policies and runs")
+    args = parser.parse_args()
+
+    config = {
+        "label": args.label,
+        "policies": args.policies,
+        "orders": {order: ORDERS[order] for order in args.orders},
+        "seeds": args.seeds,
+        "max_steps": args.max_steps,
+        "max_stall": args.max_stall,
+        "profile": args.profile,
+        "plan_cache": args.plan_cache,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    episodes, summary = run_benchmark(
+        args.policies,
+        args.orders,
+        args.seeds,
+        args.max_steps,
+        args.max_stall,
+        profile=args.profile,
+        plan_cache=PlanCache(capacity=1024, path=args.plan_cache) if args.plan_cache else None,
+    )
+    write_results(args.output, config, episodes, summary)
+
+    print()
+    print(f"{'policy':>8} {'order':>6} {'done':>5} {'ep/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'trim':>6} {'filled':>6} {'stocks':>6}")
+    for row in summary:
+        print(
+            f"{row['policy']:>8} {row['order']:>6} {row['completed']:>2}/{row['episodes']:<2} "
+            f"{row['episodes_per_sec']:>7.2f} {row['latency_p50_ms']:>8.2f} {row['latency_p99_ms']:>8.2f} "
+            f"{row['trim_loss']:>6.3f} {row['filled_ratio']:>6.3f} {row['stocks_used']:>6.1f}"
+        )
+    if args.profile:
+        print()
+        print(f"{'policy':>8} {'order':>6} {'phase':>24} {'calls':>9} {'total s':>9} {'mean ms':>9} {'max ms':>9}")
+        for row in summary:
+            phases = sorted(row["profile"].items(), key=lambda item: item[1]["total_s"], reverse=True)
+            phases = [(phase, stats) for phase, stats in phases if stats["calls"]]
+            for phase, stats in phases:
+                print(
+                    f"{row['policy']:>8} {row['order']:>6} {phase:>24} {stats['calls']:>9} "
+                    f"{stats['total_s']:>9.3f} {stats['mean_ms']:>9.3f} {stats['max_ms']:>9.3f}"
+                )
+    print(f"Results written to {args.output}.csv and {args.output}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Placement kernels shared by the policies.
+
+fit_mask and first_fit search a summed-area table (PlacementIndex.table) for the top-left corners
+where a product fits, rect_free tests a rectangle of a stock grid, and overlap_waste scores a batch of
+solutions with the rule of evaluate_solution. When numba is installed the kernels are compiled
+loops with early exits, otherwise they fall back to numpy. BACKEND tells which one is used.
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKEND = "numba" if numba is not None else "numpy"
+
+
+def fit_mask(table, prod_w, prod_h):
+    """
+    Boolean mask over the top-left corners (x, y) where a prod_w x prod_h product fits, from the summed-area
+    table of the free cells (table[i, j] = free cells in stock[:i, :j]). The mask is empty when the product
+    is larger than the stock.
+    """
+    prod_w, prod_h = int(prod_w), int(prod_h)
+    stock_w, stock_h = table.shape[0] - 1, table.shape[1] - 1
+    if prod_w <= 0 or prod_h <= 0 or prod_w > stock_w or prod_h > stock_h:
+        return np.zeros((0, 0), dtype=bool)
+    free = (
+        table[prod_w:, prod_h:]
+        - table[: stock_w - prod_w + 1, prod_h:]
+        - table[prod_w:, : stock_h - prod_h + 1]
+        + table[: stock_w - prod_w + 1, : stock_h - prod_h + 1]
+    )
+    return free == prod_w * prod_h
+
+
+def _first_fit_numpy(table, prod_w, prod_h):
+    mask = fit_mask(table, prod_w, prod_h)
+    hits = np.flatnonzero(mask)
+    if hits.size == 0:
+        return -1, -1
+    pos_x, pos_y = divmod(int(hits[0]), mask.shape[1])
+    return pos_x, pos_y
+
+
+def _first_fit_loop(table, prod_w, prod_h):
+    stock_w, stock_h = table.shape[0] - 1, table.shape[1] - 1
+    if prod_w <= 0 or prod_h <= 0 or prod_w > stock_w or prod_h > stock_h:
+        return -1, -1
+    area = prod_w * prod_h
+    for x in range(stock_w - prod_w + 1):
+        for y in range(stock_h - prod_h + 1):
+            if table[x + prod_w, y + prod_h] - table[x, y + prod_h] - table[x + prod_w, y] + table[x, y] == area:
+                return x, y
+    return -1, -1
+
+
+def _rect_free_numpy(stock, pos_x, pos_y, prod_w, prod_h):
+    return bool(np.all(stock[pos_x : pos_x + prod_w, pos_y : pos_y + prod_h] == -1))
+
+
+def _rect_free_loop(stock, pos_x, pos_y, prod_w, prod_h):
+    for x in range(pos_x, min(pos_x + prod_w, stock.shape[0])):
+        for y in range(pos_y, min(pos_y + prod_h, stock.shape[1])):
+            if stock[x, y] != -1:
+                return False
+    return True
+
+
+def _overlap_waste_numpy(free, cuts):
+    # Vectorized over the solutions, one pass per cut index. A cut is accepted when the summed-area table of
+    # the free cells counts all its cells as free and it does not intersect an earlier accepted cut of its
+    # solution, which is the same as testing the cells used by the earlier accepted cuts.
+    waste = np.zeros(cuts.shape[0], dtype=np.int64)
+    if cuts.shape[1] == 0:
+        return waste
+    table = np.zeros((free.shape[0], free.shape[1] + 1, free.shape[2] + 1), dtype=np.int32)
+    np.cumsum(free, axis=1, dtype=np.int32, out=table[:, 1:, 1:])
+    np.cumsum(table[:, 1:, 1:], axis=2, out=table[:, 1:, 1:])
+
+    slot, x0, y0, x1, y1, area = np.moveaxis(cuts, 2, 0)
+    x1, y1 = np.maximum(x1, x0), np.maximum(y1, y0)
+    cells = table[slot, x1, y1] - table[slot, x0, y1] - table[slot, x1, y0] + table[slot, x0, y0]
+    all_free = cells == (x1 - x0) * (y1 - y0)
+    # Empty cuts are accepted and block nothing, in both directions of the intersection test
+    nonempty = (x0 < x1) & (y0 < y1)
+
+    accepted = np.zeros(cuts.shape[:2], dtype=bool)
+    for k in range(cuts.shape[1]):
+        hit = (
+            (accepted[:, :k] & nonempty[:, :k] & nonempty[:, k, None])
+            & (slot[:, :k] == slot[:, k, None])
+            & (x0[:, :k] < x1[:, k, None])
+            & (x0[:, k, None] < x1[:, :k])
+            & (y0[:, :k] < y1[:, k, None])
+            & (y0[:, k, None] < y1[:, :k])
+        )
+        accepted[:, k] = all_free[:, k] & ~hit.any(axis=1)
+    waste += np.where(accepted, 0, area).sum(axis=1)
+    return waste
+
+
+def _overlap_waste_loop(free, cuts):
+    waste = np.zeros(cuts.shape[0], dtype=np.int64)
+    used = np.zeros(free.shape, dtype=np.bool_)
+    accepted = np.zeros(cuts.shape[1], dtype=np.bool_)
+    for b in range(cuts.shape[0]):
+        for k in range(cuts.shape[1]):
+            stock_idx, x0, y0, x1, y1 = cuts[b, k, 0], cuts[b, k, 1], cuts[b, k, 2], cuts[b, k, 3], cuts[b, k, 4]
+            ok = True
+            for x in range(x0, x1):
+                for y in range(y0, y1):
+                    if not free[stock_idx, x, y] or used[stock_idx, x, y]:
+                        ok = False
+                        break
+                if not ok:
+                    break
+            accepted[k] = ok
+            if ok:
+                used[stock_idx, x0:x1, y0:y1] = True
+            else:
+                waste[b] += cuts[b, k, 5]
+        # Clear the cells of this solution for the next one
+        for k in range(cuts.shape[1]):
+            if accepted[k]:
+                used[cuts[b, k, 0], cuts[b, k, 1] : cuts[b, k, 3], cuts[b, k, 2] : cuts[b, k, 4]] = False
+    return waste
+
+
+if numba is not None:
+    _first_fit_kernel = numba.njit(cache=True)(_first_fit_loop)
+    _rect_free_kernel = numba.njit(cache=True)(_rect_free_loop)
+    _overlap_waste_kernel = numba.njit(cache=True)(_overlap_waste_loop)
+else:
+    _first_fit_kernel = _first_fit_numpy
+    _rect_free_kernel = _rect_free_numpy
+    _overlap_waste_kernel = _overlap_waste_numpy
+
+
+def first_fit(table, prod_w, prod_h):
+    """
+    Smallest x, then smallest y, where a prod_w x prod_h product fits, from the summed-area table of
+    the free cells (table[i, j] = free cells in stock[:i, :j]). Returns (x, y), or None if it does not fit.
+    """
+    pos_x, pos_y = _first_fit_kernel(table, int(prod_w), int(prod_h))
+    if pos_x < 0:
+        return None
+    return int(pos_x), int(pos_y)
+
+
+def rect_free(stock, pos_x, pos_y, prod_w, prod_h):
+    # True if every cell of stock[pos_x:pos_x+prod_w, pos_y:pos_y+prod_h] is free (-1), for pos_x, pos_y >= 0
+    return bool(_rect_free_kernel(stock, int(pos_x), int(pos_y), int(prod_w), int(prod_h)))
+
+
+def overlap_waste(free, cuts):
+    """
+    Waste of a batch of solutions with the rule of evaluate_solution: the cuts of a solution are
+    accepted in order when all their cells are free and not used by an earlier accepted cut, and the
+    waste is the total area of the rejected cuts.
+    free is a (stocks, width, height) bool array of the free cells. cuts is an int array of shape
+    (solutions, cuts, 6) with rows (stock_idx, x0, y0, x1, y1, area): the cut covers [x0:x1, y0:y1],
+    with 0 <= x0, y0 and x1, y1 within the stock (x1 <= x0 or y1 <= y0 for an empty cut), and area
+    is added to the waste when it is rejected. Returns an int64 array with one waste per solution.
+    """
+    free = np.ascontiguousarray(free, dtype=np.bool_)
+    cuts = np.ascontiguousarray(cuts, dtype=np.int64).reshape(len(cuts), -1, 6)
+    return _overlap_waste_kernel(free, cuts)
@@ -1,127 +1,212 @@
+"""
+Run policies on the cutting stock environment, with or without drawing it.
+
+Every policy runs for --steps steps. When an order is finished, the environment is reset and the policy
+continues with a new order. Rendering is lazy: the environment is created in rgb_array mode and a frame
+is only drawn when it is shown or recorded:
+    --render every   show every --render-every steps and the end of every order (default, every step)
+    --render end     show only the end of every order
+    --render none    headless
+--gif writes the frames of the episodes listed in --gif-episodes to a GIF file (needs Pillow) instead of,
+or on top of, showing them. The pauses of the driver are set with --start-pause, --order-pause and
+--step-pause, and --no-pause removes them all.
+
+Example:
+    python main.py --policies ffd --render none --no-pause
+    python main.py --policies greedy --render end --gif demo/greedy.gif --gif-episodes 0
+"""
+import argparse
+import os
+import time
+
 import gymnasium as gym
 import gym_cutting_stock
-from policy import GreedyPolicy, RandomPolicy
-from student_submissions.s2210xxx.policy2210xxx import Policy2312900_2310559_2420003_2312894_2312974
 import numpy as np
 
-import time
-#from student_submissions.s2210xxx.SimulatedAnnealing import SimulatedAnnealingPolicy
-# Create the environment
-env = gym.make(
-    "gym_cutting_stock/CuttingStock-v0",
-    render_mode="human",  # Comment this line to disable rendering
-)
-NUM_EPISODES = 2
+from benchmark import ORDERS, POLICIES
 
-if __name__ == "__main__":
-    # Reset the environment
-    # observation, info = env.reset(seed=42)
-    # #print(info)
-    # print(observation["stocks"])
-    # # Test GreedyPolicy
-    # gd_policy = GreedyPolicy()
-    # ep = 0
-    # while ep < NUM_EPISODES:
-    #     action = gd_policy.get_action(observation, info)
-    #     observation, reward, terminated, truncated, info = env.step(action)
-    #     print(ep, ": ", info)
-    #     print()
-    #     if terminated or truncated:
-    #         print(info)
-    #         observation, info = env.reset(seed=ep)
-    #         ep += 1
-
-    # # Reset the environment
-    # observation, info = env.reset(seed=42)
-
-    # # Test RandomPolicy
-    # rd_policy = RandomPolicy()
-    # ep = 0
-    # while ep < NUM_EPISODES:
-    #     action = rd_policy.get_action(observation, info)
-    #     observation, reward, terminated, truncated, info = env.step(action)
-    #     print(ep, ": ", info)
-    #     print()
-    #     if terminated or truncated:
-    #         print(info)
-    #         observation, info = env.reset(seed=ep)
-    #         ep += 1
-
-    #Uncomment the following code to test your policy
-    # Reset the environment
-    
-    #simulated_annealing_policy = SimulatedAnnealingPolicy()
-    # for _ in range(200):
-    
-    #This is used for testing one single list of orders
-    # products = observation["products"]
-    # _ = 0
-    # while all([product["quantity"] == 0 for product in products]) == 0:
-    #     action = policy2210xxx.get_action(observation, info)
-    #     observation, reward, terminated, truncated, info = env.step(action)
-    #     print()
-    #     print(_, "st loop: ", info)
-    #     _ += 1
-    #     #time.sleep(0.5)
-    #     #print(action)
-    #     if terminated or truncated:
-    #         print("===========================")
-    #         print("Finished final order. Final Result")
-    #         print(info)
-    #         time.sleep(10)
-    
-    observation, info = env.reset(seed=42)
-    policy2210xxx = Policy2312900_2310559_2420003_2312894_2312974(policy_id=1)
-    # This is used for testing multiple orders. When the loop time is less than 200, if the list of orders is finished,
-    # It gets a new order using reset and continue to test the policy.
-    print("First Fit Decreasing implementation:")
+TITLES = {
+    "greedy": "Greedy",
+    "random": "Random",
+    "maxrects": "MaxRects",
+    "ffd": "First Fit Decreasing",
+    "sa": "Simulated Annealing",
+    "cg": "Column Generation",
+    "ga": "Genetic Algorithm",
+}
+
+
+class Viewer:
+    """
+    pygame window showing the rgb_array frames of the environment.
+    The window is opened by the first frame, so a headless run never imports pygame.
+    """
+
+    def __init__(self, title="Cutting Stock"):
+        self.title = title
+        self.screen = None
+
+    def show(self, frame):
+        import pygame
+
+        if self.screen is None:
+            pygame.init()
+            self.screen = pygame.display.set_mode((frame.shape[1], frame.shape[0]))
+            pygame.display.set_caption(self.title)
+        # Keep the window responsive between frames
+        pygame.event.pump()
+        self.screen.blit(pygame.surfarray.make_surface(np.swapaxes(frame, 0, 1)), (0, 0))
+        pygame.display.flip()
+
+    def close(self):
+        if self.screen is not None:
+            import pygame
+
+            pygame.quit()
+            self.screen = None
+
+
+class GifRecorder:
+    # Frames of the selected episodes, written to one GIF file by save()
+    def __init__(self, path, episodes, fps=10):
+        self.path = path
+        self.episodes = set(episodes)
+        self.fps = fps
+        self.frames = []
+
+    def wants(self, episode):
+        return episode in self.episodes
+
+    def add(self, frame):
+        self.frames.append(np.asarray(frame, dtype=np.uint8))
+
+    def save(self):
+        if not self.frames:
+            print(f"No frames recorded, {self.path} not written")
+            return
+        try:
+            from PIL import Image
+        except ImportError:
+            print(f"Pillow is not installed, {self.path} not written (pip install pillow)")
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        images = [Image.fromarray(frame) for frame in self.frames]
+        images[0].save(
+            self.path, save_all=True, append_images=images[1:], duration=max(1, int(1000 / self.fps)), loop=0
+        )
+        print(f"{len(images)} frames written to {self.path}")
+
+
+def run_policy(env, name, args, viewer=None, recorder=None):
+    """
+    Run policy name for args.steps steps, starting from env.reset(seed=args.seed).
+    A frame is drawn (env.render()) only when the viewer shows it or the recorder keeps it.
+    """
+    policy = POLICIES[name]()
+    policy.seed(args.seed)
+    print(f"{TITLES.get(name, name)} implementation:")
     print("=====================================")
     print()
-    time.sleep(3)
-    for _ in range(200):
-        action = policy2210xxx.get_action(observation, info)
+    time.sleep(args.start_pause)
+
+    start = time.perf_counter()
+    observation, info = env.reset(seed=args.seed)
+    episode = 0
+    episode_steps = 0
+    for step in range(args.steps):
+        action = policy.get_action(observation, info)
         observation, reward, terminated, truncated, info = env.step(action)
-        print()
-        print(_, "st loop: ", info)
-        #print(action)
+        episode_steps += 1
+        if args.log_every and (step + 1) % args.log_every == 0:
+            print()
+            print(step, "st loop: ", info)
+
+        # The last step of the run also ends the episode for rendering
+        ended = terminated or truncated or step == args.steps - 1
+        show = viewer is not None and (ended or (args.render == "every" and episode_steps % args.render_every == 0))
+        record = recorder is not None and recorder.wants(episode) and (ended or episode_steps % args.render_every == 0)
+        if show or record:
+            frame = env.render()
+            if show:
+                viewer.show(frame)
+            if record:
+                recorder.add(frame)
+        time.sleep(args.step_pause)
+
         if terminated or truncated:
             print("===========================")
-            if _ < 199:
+            if step < args.steps - 1:
                 print("Finished order. Result: ")
                 print(info)
-                print("Getting new order in five seconds...")
-                time.sleep(5)
-                observation, info = env.reset()
+                if args.order_pause:
+                    print(f"Getting new order in {args.order_pause:g} seconds...")
+                time.sleep(args.order_pause)
             else:
                 print("Finished final order. Final Result")
                 print(info)
-                time.sleep(5)
-                observation, info = env.reset()
-    
-    observation, info = env.reset(seed=42)        
-    policy2210xxx = Policy2312900_2310559_2420003_2312894_2312974(policy_id=2)
-    print("Simulated Annealing implementation:")
-    print("=====================================")
+                time.sleep(args.order_pause)
+            observation, info = env.reset()
+            episode += 1
+            episode_steps = 0
+
+    print(f"{args.steps} steps in {time.perf_counter() - start:.2f}s")
     print()
-    time.sleep(3)
-    for _ in range(200):
-        action = policy2210xxx.get_action(observation, info)
-        observation, reward, terminated, truncated, info = env.step(action)
-        print()
-        print(_, "st loop: ", info)
-        #print(action)
-        if terminated or truncated:
-            print("===========================")
-            if _ < 199:
-                print("Finished order. Result: ")
-                print(info)
-                print("Getting new order in five seconds...")
-                time.sleep(5)
-                observation, info = env.reset()
-            else:
-                print("Finished final order. Final Result")
-                print(info)
-                time.sleep(5)
-                observation, info = env.reset()
+    if hasattr(policy, "close"):
+        policy.close()
+    return info
+
 
-env.close()
+def main():
+    parser = argparse.ArgumentParser(description="Run cutting stock policies, with lazy rendering and GIF recording.")
+    parser.add_argument("--policies", nargs="+", choices=list(POLICIES), default=["ffd", "sa"])
+    parser.add_argument("--order", choices=list(ORDERS), default=None, help="order size (default: environment defaults)")
+    parser.add_argument("--steps", type=int, default=200, help="steps of every policy, over as many orders as needed")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the first order and of the policy")
+    parser.add_argument("--render", choices=["every", "end", "none"], default="every", help="when to show the stocks")
+    parser.add_argument("--render-every", type=int, default=1, metavar="N", help="draw every N steps with --render every and --gif")
+    parser.add_argument("--gif", default=None, metavar="PATH", help="record the episodes of --gif-episodes to this GIF file")
+    parser.add_argument("--gif-episodes", nargs="+", type=int, default=[0], help="episodes of each policy to record, from 0")
+    parser.add_argument("--gif-fps", type=float, default=10)
+    parser.add_argument("--start-pause", type=float, default=3, help="seconds to wait before every policy")
+    parser.add_argument("--order-pause", type=float, default=5, help="seconds to wait after every finished order")
+    parser.add_argument("--step-pause", type=float, default=0, help="seconds to wait after every step")
+    parser.add_argument("--no-pause", action="store_true", help="set all the pauses to 0")
+    parser.add_argument("--log-every", type=int, default=1, metavar="N", help="print the info every N steps, 0 for never")
+    args = parser.parse_args()
+    args.render_every = max(1, args.render_every)
+    if args.no_pause:
+        args.start_pause = args.order_pause = args.step_pause = 0
+
+    # Frames are only drawn on request, so the environment never renders by itself
+    drawing = args.render != "none" or args.gif is not None
+    env = gym.make(
+        "gym_cutting_stock/CuttingStock-v0",
+        render_mode="rgb_array" if drawing else None,
+        **(ORDERS[args.order] if args.order else {}),
+    )
+    viewer = Viewer() if args.render != "none" else None
+    recorders = []
+    try:
+        for name in args.policies:
+            recorder = None
+            if args.gif is not None:
+                # One GIF per policy when several policies are run
+                path = args.gif
+                if len(args.policies) > 1:
+                    root, ext = os.path.splitext(args.gif)
+                    path = f"{root}_{name}{ext or '.gif'}"
+                recorder = GifRecorder(path, args.gif_episodes, args.gif_fps)
+                recorders.append(recorder)
+            run_policy(env, name, args, viewer, recorder)
+    finally:
+        for recorder in recorders:
+            recorder.save()
+        if viewer is not None:
+            viewer.close()
+        env.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,510 @@
-import random
+import hashlib
+import inspect
+import json
+import os
+import time
 from abc import abstractmethod
+from collections import OrderedDict
 
 import numpy as np
 
+import kernels
+
+
+class PlacementIndex:
+    """
+    Summed-area table over the free (-1) cells of one stock.
+    table[i, j] is the number of free cells in stock[:i, :j], so the free count
+    of any rectangle is four lookups and every top-left corner that fits a
+    product can be found in one vectorized pass.
+    """
+
+    def __init__(self, stock):
+        self.shape = stock.shape
+        self.table = np.zeros((self.shape[0] + 1, self.shape[1] + 1), dtype=np.int32)
+        self.table[1:, 1:] = (stock == -1).cumsum(axis=0).cumsum(axis=1)
+
+    def feasible(self, prod_size):
+        # Boolean mask over top-left corners (x, y) where the product fits
+        return kernels.fit_mask(self.table, prod_size[0], prod_size[1])
+
+    def copy(self):
+        index = PlacementIndex.__new__(PlacementIndex)
+        index.shape = self.shape
+        index.table = self.table.copy()
+        return index
+
+    def first_fit(self, prod_size):
+        # Smallest x first, then smallest y, the same order as a nested x/y scan
+        return kernels.first_fit(self.table, prod_size[0], prod_size[1])
+
+    def mark(self, position, prod_size):
+        # Remove a newly cut rectangle from the table without rebuilding it.
+        # Entry (i, j) loses the overlap of the rectangle with stock[:i, :j],
+        # which is an outer product of the clipped row and column overlaps.
+        pos_x, pos_y = int(position[0]), int(position[1])
+        prod_w, prod_h = int(prod_size[0]), int(prod_size[1])
+        rows = np.minimum(np.arange(1, self.shape[0] + 1 - pos_x, dtype=np.int32), prod_w)
+        cols = np.minimum(np.arange(1, self.shape[1] + 1 - pos_y, dtype=np.int32), prod_h)
+        self.table[pos_x + 1 :, pos_y + 1 :] -= rows[:, None] * cols
+
+
+class StockBitset:
+    """
+    Occupancy of one stock with one bit per cell.
+    rows[x] is a Python int whose bit y is set when stock[x, y] is not free (cut or outside the stock),
+    so a 100x100 stock takes 100 ints instead of 10000 array cells, and testing or marking a
+    rectangle is one AND or OR per row.
+    """
+
+    def __init__(self, rows, shape):
+        self.rows = rows
+        self.shape = shape
+
+    @classmethod
+    def from_stock(cls, stock):
+        packed = np.packbits(stock != -1, axis=1, bitorder="little")
+        return cls([int.from_bytes(row.tobytes(), "little") for row in packed], stock.shape)
+
+    def copy(self):
+        return StockBitset(list(self.rows), self.shape)
+
+    def is_free(self, position, prod_size):
+        pos_x, pos_y = int(position[0]), int(position[1])
+        prod_w, prod_h = int(prod_size[0]), int(prod_size[1])
+        if pos_x < 0 or pos_y < 0 or pos_x + prod_w > self.shape[0] or pos_y + prod_h > self.shape[1]:
+            return False
+        mask = ((1 << prod_h) - 1) << pos_y
+        return not any(row & mask for row in self.rows[pos_x : pos_x + prod_w])
+
+    def mark(self, position, prod_size):
+        pos_x, pos_y = int(position[0]), int(position[1])
+        prod_w, prod_h = int(prod_size[0]), int(prod_size[1])
+        mask = ((1 << prod_h) - 1) << pos_y
+        for x in range(pos_x, pos_x + prod_w):
+            self.rows[x] |= mask
+
+    def first_fit(self, prod_size):
+        # Smallest x first, then smallest y, the same order as PlacementIndex.first_fit
+        prod_w, prod_h = int(prod_size[0]), int(prod_size[1])
+        stock_w, stock_h = self.shape
+        if prod_w <= 0 or prod_h <= 0 or prod_w > stock_w or prod_h > stock_h:
+            return None
+
+        # used[x] has bit y set when a cell of column y in rows x..x+prod_w-1 is not free.
+        # Windows are doubled (1, 2, 4, ... rows) so this takes O(stock_w log prod_w) ORs.
+        used, window = self.rows, 1
+        while window < prod_w:
+            step = min(window, prod_w - window)
+            used = [a | b for a, b in zip(used, used[step:])]
+            window += step
+
+        full = (1 << stock_h) - 1
+        for pos_x, row in enumerate(used):
+            # Bit y of free stays set when columns y..y+prod_h-1 are all free, doubled the same way
+            free, run = ~row & full, 1
+            while free and run < prod_h:
+                step = min(run, prod_h - run)
+                free &= free >> step
+                run += step
+            if free:
+                return pos_x, (free & -free).bit_length() - 1
+        return None
+
+
+class FreeRectangles:
+    """
+    Maximal free rectangles of one stock, stored as (x, y, w, h) tuples.
+    Every free cell is covered by at least one rectangle and no rectangle is
+    contained in another, so a product fits the stock iff it fits one of them.
+    """
+
+    def __init__(self, stock_w, stock_h):
+        self.rects = [(0, 0, stock_w, stock_h)] if stock_w > 0 and stock_h > 0 else []
+
+    @classmethod
+    def from_stock(cls, stock, stock_w, stock_h):
+        free_rects = cls(stock_w, stock_h)
+        used = stock[:stock_w, :stock_h] != -1
+        if not used.any():
+            return free_rects
+
+        # Cover the used cells with rectangles by merging identical runs of
+        # consecutive rows, then carve each of them out of the free space.
+        padded = np.zeros((stock_w, stock_h + 2), dtype=np.int8)
+        padded[:, 1:-1] = used
+        edges = np.diff(padded, axis=1)
+        starts = np.argwhere(edges == 1)
+        ends = np.argwhere(edges == -1)
+
+        runs = [set() for _ in range(stock_w)]
+        for (row, start), (_, end) in zip(starts.tolist(), ends.tolist()):
+            runs[row].add((start, end))
+
+        opened = {}
+        for row in range(stock_w + 1):
+            current = runs[row] if row < stock_w else set()
+            for run in list(opened):
+                if run not in current:
+                    start_row = opened.pop(run)
+                    free_rects.place((start_row, run[0]), (row - start_row, run[1] - run[0]))
+            for run in current:
+                opened.setdefault(run, row)
+        return free_rects
+
+    def place(self, position, prod_size):
+        # Split every free rectangle that overlaps the cut into the (up to four)
+        # maximal rectangles around it, then drop the ones contained in others
+        pos_x, pos_y = int(position[0]), int(position[1])
+        prod_w, prod_h = int(prod_size[0]), int(prod_size[1])
+        end_x, end_y = pos_x + prod_w, pos_y + prod_h
+
+        split = []
+        for rect in self.rects:
+            x, y, w, h = rect
+            if pos_x >= x + w or end_x <= x or pos_y >= y + h or end_y <= y:
+                split.append(rect)
+                continue
+            if pos_x > x:
+                split.append((x, y, pos_x - x, h))
+            if end_x < x + w:
+                split.append((end_x, y, x + w - end_x, h))
+            if pos_y > y:
+                split.append((x, y, w, pos_y - y))
+            if end_y < y + h:
+                split.append((x, end_y, w, y + h - end_y))
+
+        self.rects = [
+            rect
+            for i, rect in enumerate(split)
+            if not any(
+                j != i
+                and other[0] <= rect[0]
+                and other[1] <= rect[1]
+                and other[0] + other[2] >= rect[0] + rect[2]
+                and other[1] + other[3] >= rect[1] + rect[3]
+                and (other != rect or j < i)
+                for j, other in enumerate(split)
+            )
+        ]
+
+
+class StockState:
+    """
+    Derived state of one stock: size, free area, placement index, occupancy
+    bits and free rectangles. It is built once from the stock grid and then
+    updated with place() for every cut, so it never has to rescan the grid.
+    The placement index, bits and free rectangles are built the first time
+    they are used, from a free mask that place() keeps up to date until then,
+    so stocks a policy never looks at cost only their size and free area.
+    """
+
+    def __init__(self, stock):
+        self.size = (
+            int(np.sum(np.any(stock != -2, axis=1))),
+            int(np.sum(np.any(stock != -2, axis=0))),
+        )
+        self._free = stock == -1
+        self.free_area = int(np.count_nonzero(self._free))
+        self._index = None
+        self._bits = None
+        self._free_rects = None
+
+    def _grid(self):
+        # Stock grid rebuilt from the free mask, with 0 for every cell that is not free
+        return np.where(self._free, -1, 0)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = PlacementIndex(self._grid())
+        return self._index
+
+    @property
+    def bits(self):
+        if self._bits is None:
+            self._bits = StockBitset.from_stock(self._grid())
+        return self._bits
+
+    @property
+    def free_rects(self):
+        if self._free_rects is None:
+            self._free_rects = FreeRectangles.from_stock(self._grid(), *self.size)
+        return self._free_rects
+
+    def matches(self, stock):
+        # Cheap check that the grid still has the size this state was built for
+        stock_w, stock_h = self.size
+        if stock_w == 0 or stock_h == 0:
+            return not np.any(stock != -2)
+        return (
+            stock[stock_w - 1, stock_h - 1] != -2
+            and (stock_w == stock.shape[0] or stock[stock_w, 0] == -2)
+            and (stock_h == stock.shape[1] or stock[0, stock_h] == -2)
+        )
+
+    def place(self, position, prod_size):
+        self.free_area -= int(prod_size[0]) * int(prod_size[1])
+        self._free[position[0] : position[0] + prod_size[0], position[1] : position[1] + prod_size[1]] = False
+        if self._index is not None:
+            self._index.mark(position, prod_size)
+        if self._bits is not None:
+            self._bits.mark(position, prod_size)
+        if self._free_rects is not None:
+            self._free_rects.place(position, prod_size)
+
+
+class StockIndex:
+    """
+    Sizes and free areas of a list of StockState as arrays, to find in one
+    vectorized pass the stocks that can hold a product, instead of trying
+    every stock. Call update() after placing a cut in one of the states.
+    """
+
+    def __init__(self, states):
+        self.states = states
+        self.widths = np.array([state.size[0] for state in states], dtype=np.int64)
+        self.heights = np.array([state.size[1] for state in states], dtype=np.int64)
+        self.free_area = np.array([state.free_area for state in states], dtype=np.int64)
+
+    def update(self, stock_idx):
+        self.free_area[stock_idx] = self.states[stock_idx].free_area
+
+    def fits(self, stock_idx, prod_size):
+        # Exact: the product fits iff one of the maximal free rectangles can hold it
+        prod_w, prod_h = int(prod_size[0]), int(prod_size[1])
+        return any(w >= prod_w and h >= prod_h for _, _, w, h in self.states[stock_idx].free_rects.rects)
+
+    def sized(self, prod_size):
+        # Mask of the stocks large enough for the product in at least one orientation, ignoring cuts
+        prod_w, prod_h = int(prod_size[0]), int(prod_size[1])
+        return ((self.widths >= prod_w) & (self.heights >= prod_h)) | ((self.widths >= prod_h) & (self.heights >= prod_w))
+
+    def candidates(self, prod_size, order=None):
+        # Stocks where the product fits in at least one orientation, in increasing index order or in order.
+        # Size and free area are checked for all stocks at once, the exact check only for the stocks
+        # the caller reaches before it stops iterating.
+        prod_w, prod_h = int(prod_size[0]), int(prod_size[1])
+        mask = self.sized(prod_size) & (self.free_area >= prod_w * prod_h)
+        selected = np.flatnonzero(mask).tolist() if order is None else [i for i in order if mask[i]]
+        for stock_idx in selected:
+            if self.fits(stock_idx, (prod_w, prod_h)) or self.fits(stock_idx, (prod_h, prod_w)):
+                yield stock_idx
+
+
+class StockCache:
+    """
+    Per-policy list of StockState kept in sync with the observations.
+
+    An env step changes at most one rectangle of one stock: the one from the
+    action the policy returned. sync() checks that the product quantities
+    dropped by at most one and that the predicted rectangle is now cut, and
+    then only updates that stock. Anything else (env.reset, a new order, an
+    observation from another env) rebuilds every state from the grids.
+    """
+
+    def __init__(self):
+        self.states = None
+        self.index = None
+        self.generation = 0
+        self._products = None
+        self._expected = None
+
+    def invalidate(self):
+        self.states = None
+        self.index = None
+        self._products = None
+        self._expected = None
+
+    def expect(self, action):
+        # Remember the action returned to the env, it predicts the next change
+        self._expected = action
+
+    def sync(self, observation):
+        stocks = observation["stocks"]
+        products = tuple(
+            (int(prod["size"][0]), int(prod["size"][1]), int(prod["quantity"]))
+            for prod in observation["products"]
+        )
+
+        if not self._apply_step(stocks, products):
+            self.states = [StockState(stock) for stock in stocks]
+            self.index = StockIndex(self.states)
+            # Tells users of the states that anything derived from the previous ones is stale
+            self.generation += 1
+
+        self._products = products
+        self._expected = None
+        return self.states
+
+    def _apply_step(self, stocks, products):
+        # Returns False when the cached states cannot be carried over
+        if self.states is None or len(stocks) != len(self.states):
+            return False
+
+        previous = self._products
+        if len(products) != len(previous):
+            return False
+        placed = None
+        for old, new in zip(previous, products):
+            if old[:2] != new[:2] or new[2] > old[2]:
+                return False
+            if new[2] < old[2]:
+                if placed is not None or new[2] != old[2] - 1:
+                    return False
+                placed = new[:2]
+
+        if not all(state.matches(stock) for state, stock in zip(self.states, stocks)):
+            return False
+        if placed is None:
+            return True
+
+        # Exactly one product was cut, it must be the one we asked for
+        action = self._expected
+        if action is None:
+            return False
+        stock_idx = int(action["stock_idx"])
+        prod_w, prod_h = int(action["size"][0]), int(action["size"][1])
+        if (prod_w, prod_h) != placed and (prod_h, prod_w) != placed:
+            return False
+        if not 0 <= stock_idx < len(stocks) or None in tuple(action["position"]):
+            return False
+        pos_x, pos_y = int(action["position"][0]), int(action["position"][1])
+        state = self.states[stock_idx]
+        if pos_x < 0 or pos_y < 0 or pos_x + prod_w > state.size[0] or pos_y + prod_h > state.size[1]:
+            return False
+        if np.any(stocks[stock_idx][pos_x : pos_x + prod_w, pos_y : pos_y + prod_h] == -1):
+            return False
+
+        state.place((pos_x, pos_y), (prod_w, prod_h))
+        self.index.update(stock_idx)
+        return True
+
+
+class PhaseTimer:
+    """
+    Stand-in for a bound method that counts its calls and their wall time.
+    Policy.enable_profiling stores one per phase as an instance attribute, in front of the method of the class.
+    A generator method does its work while it is iterated, so its time is the time spent in each of its steps.
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.generator = inspect.isgeneratorfunction(method)
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def __call__(self, *args, **kwargs):
+        if self.generator:
+            return self._iterate(self.method(*args, **kwargs))
+        start = time.perf_counter()
+        try:
+            return self.method(*args, **kwargs)
+        finally:
+            self._add(time.perf_counter() - start)
+
+    def _iterate(self, iterator):
+        # One call per generator, counted when it is exhausted or dropped
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self._add(elapsed)
+
+    def _add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "total_s": self.total,
+            "mean_ms": self.total / self.calls * 1000 if self.calls else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class PlanCache:
+    """
+    Least recently used cache of cutting plans, keyed by PlanCache.key of the order.
+    Plans must be JSON serializable. With a path, the cache is loaded from that JSON file
+    and written back after every put, so plans survive between runs.
+    """
+
+    def __init__(self, capacity=128, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.plans = OrderedDict()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.plans.update(json.load(f))
+            self._evict()
+
+    @staticmethod
+    def key(stocks, products, params):
+        # Canonical hash of the stock sizes and free cells, the products and the policy parameters
+        digest = hashlib.sha256()
+        for stock in stocks:
+            digest.update(np.array(stock.shape, dtype=np.int64).tobytes())
+            digest.update(np.packbits(stock != -2).tobytes())
+            digest.update(np.packbits(stock == -1).tobytes())
+        digest.update(
+            json.dumps(
+                [[int(prod["size"][0]), int(prod["size"][1]), int(prod["quantity"])] for prod in products]
+            ).encode()
+        )
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        plan = self.plans.get(key)
+        if plan is not None:
+            self.plans.move_to_end(key)
+        return plan
+
+    def put(self, key, plan):
+        self.plans[key] = plan
+        self.plans.move_to_end(key)
+        self._evict()
+        if self.path is not None:
+            self.save()
+
+    def save(self):
+        # Write to a temporary file first so that an interrupted run never leaves a broken cache
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.plans, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def _evict(self):
+        while len(self.plans) > self.capacity:
+            self.plans.popitem(last=False)
+
+    def __len__(self):
+        return len(self.plans)
+
 
 class Policy:
+    _stock_cache = None
+    _rng = None
+
+    # Methods timed by enable_profiling. Subclasses extend the tuple with their own phases.
+    profile_phases = ("get_action", "_get_stock_size_", "_can_place_")
+    _profile = None
+
     @abstractmethod
     def __init__(self):
         pass
@@ -13,6 +513,22 @@ class Policy:
     def get_action(self, observation, info):
         pass
 
+    def seed(self, seed=None):
+        # Restart the random generator of the policy, None seeds it from the OS
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def rng(self):
+        # numpy.random.Generator of this policy, so that seeded runs are reproducible
+        if self._rng is None:
+            self.seed()
+        return self._rng
+
+    def get_actions(self, observations, infos):
+        # Batched entry point for vectorized rollouts: one observation and info per env.
+        # Policies that can decide for all envs at once override it, the default asks get_action per env.
+        return [self.get_action(observation, info) for observation, info in zip(observations, infos)]
+
     def _get_stock_size_(self, stock):
         stock_w = np.sum(np.any(stock != -2, axis=1))
         stock_h = np.sum(np.any(stock != -2, axis=0))
@@ -20,15 +536,65 @@ class Policy:
         return stock_w, stock_h
 
     def _can_place_(self, stock, position, prod_size):
+        if isinstance(stock, StockBitset):
+            return stock.is_free(position, prod_size)
+
         pos_x, pos_y = position
         prod_w, prod_h = prod_size
 
+        if pos_x >= 0 and pos_y >= 0:
+            return kernels.rect_free(stock, pos_x, pos_y, prod_w, prod_h)
         return np.all(stock[pos_x : pos_x + prod_w, pos_y : pos_y + prod_h] == -1)
 
+    def _find_position_(self, stock, prod_size, index=None):
+        # First-fit top-left corner for the product, or None if it does not fit.
+        # index is the PlacementIndex or StockBitset of the stock if the caller already has one.
+        if index is None:
+            index = PlacementIndex(stock)
+        return index.first_fit(prod_size)
+
+    def _get_stock_states_(self, observation):
+        # Cached StockState of every stock, updated incrementally between steps
+        if self._stock_cache is None:
+            self._stock_cache = StockCache()
+        return self._stock_cache.sync(observation)
+
+    def _get_stock_index_(self):
+        # StockIndex over the states returned by the last _get_stock_states_
+        return self._stock_cache.index
+
+    def _record_action_(self, action):
+        # Tell the stock cache which cut the env is about to apply
+        if self._stock_cache is not None:
+            self._stock_cache.expect(action)
+        return action
+
+    def enable_profiling(self):
+        """
+        Count the calls and wall time of every method in profile_phases, until disable_profiling is called.
+        Each method is shadowed by a PhaseTimer instance attribute, so a policy that is not profiled
+        calls its methods directly. Times are inclusive: get_action contains the phases it calls.
+        """
+        self.disable_profiling()
+        self._profile = {}
+        for phase in self.profile_phases:
+            if callable(getattr(self, phase, None)):
+                self._profile[phase] = PhaseTimer(getattr(self, phase))
+                setattr(self, phase, self._profile[phase])
+
+    def disable_profiling(self):
+        # Remove the timers, the statistics collected so far stay available in profile_stats
+        for phase in (self._profile or {}):
+            self.__dict__.pop(phase, None)
+
+    def profile_stats(self):
+        # {phase: {"calls", "total_s", "mean_ms", "max_ms"}} of the last enable_profiling, {} if never enabled
+        return {phase: timer.stats() for phase, timer in (self._profile or {}).items()}
+
 
 class RandomPolicy(Policy):
-    def __init__(self):
-        pass
+    def __init__(self, seed=None):
+        self.seed(seed)
 
     def get_action(self, observation, info):
         list_prods = observation["products"]
@@ -46,7 +612,7 @@ class RandomPolicy(Policy):
                 pos_x, pos_y = None, None
                 for _ in range(100):
                     # random choice a stock
-                    stock_idx = random.randint(0, len(observation["stocks"]) - 1)
+                    stock_idx = int(self.rng.integers(len(observation["stocks"])))
                     stock = observation["stocks"][stock_idx]
 
                     # Random choice a position
@@ -54,14 +620,14 @@ class RandomPolicy(Policy):
                     prod_w, prod_h = prod_size
 
                     if stock_w >= prod_w and stock_h >= prod_h:
-                        pos_x = random.randint(0, stock_w - prod_w)
-                        pos_y = random.randint(0, stock_h - prod_h)
+                        pos_x = int(self.rng.integers(stock_w - prod_w + 1))
+                        pos_y = int(self.rng.integers(stock_h - prod_h + 1))
                         if self._can_place_(stock, (pos_x, pos_y), prod_size):
                             break
 
                     if stock_w >= prod_h and stock_h >= prod_w:
-                        pos_x = random.randint(0, stock_w - prod_h)
-                        pos_y = random.randint(0, stock_h - prod_w)
+                        pos_x = int(self.rng.integers(stock_w - prod_h + 1))
+                        pos_y = int(self.rng.integers(stock_h - prod_w + 1))
                         if self._can_place_(stock, (pos_x, pos_y), prod_size[::-1]):
                             prod_size = prod_size[::-1]
                             break
@@ -78,6 +644,8 @@ class GreedyPolicy(Policy):
 
     def get_action(self, observation, info):
         list_prods = observation["products"]
+        stock_states = self._get_stock_states_(observation)
+        stock_index = self._get_stock_index_()
 
         prod_size = [0, 0]
         stock_idx = -1
@@ -88,38 +656,115 @@ class GreedyPolicy(Policy):
             if prod["quantity"] > 0:
                 prod_size = prod["size"]
 
-                # Loop through all stocks
-                for i, stock in enumerate(observation["stocks"]):
-                    stock_w, stock_h = self._get_stock_size_(stock)
+                # Only the stocks that can hold the product are tried, the others would not give a position
+                if stock_index.sized(prod_size).any():
+                    pos_x, pos_y = None, None
+
+                # Loop through the stocks
+                for i in stock_index.candidates(prod_size):
+                    stock = observation["stocks"][i]
+                    stock_w, stock_h = stock_states[i].size
                     prod_w, prod_h = prod_size
-                    if stock_w >= prod_w and stock_h >= prod_h:
+                    index = stock_states[i].index
+                    if stock_w >= prod_w and stock_h >= prod_h and stock_index.fits(i, prod_size):
                         pos_x, pos_y = None, None
-                        for x in range(stock_w - prod_w + 1):
-                            for y in range(stock_h - prod_h + 1):
-                                if self._can_place_(stock, (x, y), prod_size):
-                                    pos_x, pos_y = x, y
-                                    break
-                            if pos_x is not None and pos_y is not None:
-                                break
-                        if pos_x is not None and pos_y is not None:
+                        position = self._find_position_(stock, prod_size, index)
+                        if position is not None:
+                            pos_x, pos_y = position
                             stock_idx = i
                             break
 
-                    if stock_w >= prod_h and stock_h >= prod_w:
+                    if stock_w >= prod_h and stock_h >= prod_w and stock_index.fits(i, prod_size[::-1]):
                         pos_x, pos_y = None, None
-                        for x in range(stock_w - prod_h + 1):
-                            for y in range(stock_h - prod_w + 1):
-                                if self._can_place_(stock, (x, y), prod_size[::-1]):
-                                    prod_size = prod_size[::-1]
-                                    pos_x, pos_y = x, y
-                                    break
-                            if pos_x is not None and pos_y is not None:
-                                break
-                        if pos_x is not None and pos_y is not None:
+                        position = self._find_position_(stock, prod_size[::-1], index)
+                        if position is not None:
+                            prod_size = prod_size[::-1]
+                            pos_x, pos_y = position
                             stock_idx = i
                             break
 
                 if pos_x is not None and pos_y is not None:
                     break
 
-        return {"stock_idx": stock_idx, "size": prod_size, "position": (pos_x, pos_y)}
+        return self._record_action_(
+            {"stock_idx": stock_idx, "size": prod_size, "position": (pos_x, pos_y)}
+        )
+
+
+class MaxRectsPolicy(Policy):
+    """
+    Placement on the maximal free rectangles of each stock (MaxRects).
+    A product is placed at the corner of one free rectangle, so a stock is
+    checked in O(number of free rectangles) instead of scanning its cells.
+    Products are taken in decreasing area and stocks in index order; inside
+    the first stock that fits, the rectangle is chosen by the heuristic:
+      "bssf": best short side fit, the smallest leftover side
+      "bl":   bottom-left, the smallest x, then the smallest y
+      "cp":   contact point, the longest border touching cuts or stock edges
+    """
+
+    def __init__(self, heuristic="bssf"):
+        assert heuristic in ["bssf", "bl", "cp"], "Heuristic must be bssf, bl or cp"
+        self.heuristic = heuristic
+
+    def get_action(self, observation, info):
+        stock_states = self._get_stock_states_(observation)
+        stock_index = self._get_stock_index_()
+        list_prods = sorted(
+            (prod for prod in observation["products"] if prod["quantity"] > 0),
+            key=lambda prod: prod["size"][0] * prod["size"][1],
+            reverse=True,
+        )
+
+        for prod in list_prods:
+            prod_size = prod["size"]
+            for i in stock_index.candidates(prod_size):
+                state = stock_states[i]
+                best_score, best_action = None, None
+                for rect in state.free_rects.rects:
+                    for size in (prod_size, prod_size[::-1]):
+                        if size[0] > rect[2] or size[1] > rect[3]:
+                            continue
+                        score = self._score_(observation["stocks"][i], rect, size)
+                        if best_score is None or score < best_score:
+                            best_score = score
+                            best_action = {"stock_idx": i, "size": size, "position": (rect[0], rect[1])}
+                if best_action is not None:
+                    return self._record_action_(best_action)
+
+        return {"stock_idx": 0, "size": [0, 0], "position": (0, 0)}
+
+    def _score_(self, stock, rect, prod_size):
+        # Lower is better
+        pos_x, pos_y, rect_w, rect_h = rect
+        prod_w, prod_h = int(prod_size[0]), int(prod_size[1])
+        if self.heuristic == "bssf":
+            leftover_w, leftover_h = rect_w - prod_w, rect_h - prod_h
+            return min(leftover_w, leftover_h), max(leftover_w, leftover_h)
+        if self.heuristic == "bl":
+            return pos_x, pos_y
+        return -self._contact_(stock, (pos_x, pos_y), (prod_w, prod_h)), pos_x, pos_y
+
+    def _contact_(self, stock, position, prod_size):
+        # Border cells of the product that touch a cut, the outside (-2) or the grid edge
+        pos_x, pos_y = position
+        prod_w, prod_h = prod_size
+        stock_w, stock_h = stock.shape
+        contact = 0
+        if pos_x == 0:
+            contact += prod_h
+        else:
+            contact += np.count_nonzero(stock[pos_x - 1, pos_y : pos_y + prod_h] != -1)
+        if pos_x + prod_w == stock_w:
+            contact += prod_h
+        else:
+            contact += np.count_nonzero(stock[pos_x + prod_w, pos_y : pos_y + prod_h] != -1)
+        if pos_y == 0:
+            contact += prod_w
+        else:
+            contact += np.count_nonzero(stock[pos_x : pos_x + prod_w, pos_y - 1] != -1)
+        if pos_y + prod_h == stock_h:
+            contact += prod_w
+        else:
+            contact += np.count_nonzero(stock[pos_x : pos_x + prod_w, pos_y + prod_h] != -1)
+        return contact
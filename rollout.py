@@ -0,0 +1,276 @@
+"""
+Rollouts of a policy on many cutting stock environments at once, one episode per seed.
+
+Policies that only implement get_action run whole episodes in worker processes (one env and
+one copy of the policy per worker, with benchmark.run_episode), so both the policy and the
+env steps run in parallel and only the seeds and episode results cross process boundaries.
+Policies that override Policy.get_actions batch their decisions: VectorRollout then drives
+N copies of gym_cutting_stock/CuttingStock-v0 with gymnasium.vector (one process per env by
+default), hands the next seed to an env as soon as its episode ends, and at every step gives
+the policy the observations of all running envs.
+
+Example:
+    python rollout.py --policy ffd --num-envs 4 --seeds 0 1000
+"""
+import argparse
+import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import gymnasium as gym
+import gym_cutting_stock
+import numpy as np
+from gymnasium import spaces
+from gymnasium.vector import AsyncVectorEnv, AutoresetMode, SyncVectorEnv
+from gymnasium.vector.utils import concatenate, create_empty_array
+
+from benchmark import run_episode
+from policy import Policy
+
+ENV_ID = "gym_cutting_stock/CuttingStock-v0"
+
+# Sent to envs without an episode to run, and instead of actions the env could not parse
+NOOP_ACTION = {"stock_idx": 0, "size": (0, 0), "position": (0, 0)}
+
+
+class FloatInfo(gym.Wrapper):
+    """
+    Casts the numbers of info to float. The vector env merges the infos of all envs into arrays
+    typed after the first env, and the env reports trim_loss as the int 1 before the first cut,
+    which would truncate the trim loss of the other envs to 0.
+    """
+
+    def reset(self, **kwargs):
+        observation, info = self.env.reset(**kwargs)
+        return observation, self._cast(info)
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        return observation, reward, terminated, truncated, self._cast(info)
+
+    def _cast(self, info):
+        return {key: float(value) if isinstance(value, (int, float, np.number)) else value for key, value in info.items()}
+
+
+def make_env(**env_kwargs):
+    # Module level so that worker processes can create the env with any start method
+    return FloatInfo(gym.make(ENV_ID, **env_kwargs))
+
+
+# Env and policy of a worker process of VectorRollout, set by _init_worker
+_worker = {}
+
+
+def _init_worker(policy, env_kwargs):
+    _worker["env"] = make_env(**env_kwargs)
+    _worker["policy"] = policy
+
+
+def _run_seed(seed, max_steps, max_stall):
+    return play(_worker["env"], _worker["policy"], seed, max_steps, max_stall)
+
+
+def play(env, policy, seed, max_steps, max_stall):
+    # One episode with a fresh copy of the policy, so that no cache or plan leaks from one episode to the next
+    policy = copy.deepcopy(policy)
+    try:
+        return episode_result(run_episode(env, policy, seed, max_steps, max_stall))
+    finally:
+        if hasattr(policy, "close"):
+            policy.close()
+
+
+def episode_result(episode):
+    # Result of VectorRollout.run from a benchmark.run_episode result
+    return {
+        "seed": episode["seed"],
+        "completed": episode["completed"],
+        "steps": episode["steps"],
+        "placed": episode["placed"],
+        "wall_time": episode["wall_time"],
+        "policy_time": float(sum(episode["_latencies"])),
+        "filled_ratio": episode["filled_ratio"],
+        "trim_loss": episode["trim_loss"],
+        "stocks_used": episode["stocks_used"],
+    }
+
+
+def unbatch(space, batch, index):
+    """
+    Observation of env number index from a batched observation, following the batching rules of
+    gymnasium.vector: Dict and Tuple spaces are batched per entry, a Sequence space is batched as a tuple
+    with one sequence per env, and the other spaces as arrays with the env on the first axis.
+    """
+    if isinstance(space, spaces.Dict):
+        return {key: unbatch(subspace, batch[key], index) for key, subspace in space.spaces.items()}
+    if isinstance(space, spaces.Tuple):
+        return tuple(unbatch(subspace, batch[i], index) for i, subspace in enumerate(space.spaces))
+    return batch[index]
+
+
+def unbatch_info(infos, index):
+    # Vector env infos are {key: values of all envs, "_key": mask of the envs that have it}
+    return {
+        key: value[index]
+        for key, value in infos.items()
+        if not key.startswith("_") and infos.get("_" + key, np.ones(index + 1, dtype=bool))[index]
+    }
+
+
+class VectorRollout:
+    def __init__(self, num_envs=None, env_kwargs=None, asynchronous=True):
+        self.num_envs = num_envs or os.cpu_count() or 1
+        self.env_kwargs = env_kwargs or {}
+        self.asynchronous = asynchronous
+        self._envs = None
+
+    @property
+    def envs(self):
+        # The vector env is only created for policies that batch with get_actions
+        if self._envs is None:
+            env_fns = [partial(make_env, **self.env_kwargs) for _ in range(self.num_envs)]
+            # Envs are only reset by run(), so that every episode starts from a chosen seed.
+            # Observations hold Sequence spaces, which cannot live in shared memory.
+            if self.asynchronous:
+                self._envs = AsyncVectorEnv(env_fns, shared_memory=False, copy=False, autoreset_mode=AutoresetMode.DISABLED)
+            else:
+                self._envs = SyncVectorEnv(env_fns, copy=False, autoreset_mode=AutoresetMode.DISABLED)
+        return self._envs
+
+    def close(self):
+        if self._envs is not None:
+            self._envs.close()
+            self._envs = None
+
+    def run(self, policy, seeds, max_steps=2000, max_stall=50):
+        """
+        Run one episode per seed and return their results in the order of the seeds.
+        An episode stops when the order is finished, after max_steps steps, or after max_stall
+        steps in a row without a cut.
+        """
+        if type(policy).get_actions is Policy.get_actions:
+            return self._run_episodes(policy, seeds, max_steps, max_stall)
+        return self._run_batched(policy, seeds, max_steps, max_stall)
+
+    def _run_episodes(self, policy, seeds, max_steps, max_stall):
+        # get_action only: every episode runs with its own copy of the policy, seeded with the seed
+        # of the episode as in benchmark.run_episode, in num_envs worker processes unless asynchronous is False
+        seeds = list(seeds)
+        if not self.asynchronous or self.num_envs <= 1:
+            env = make_env(**self.env_kwargs)
+            try:
+                return [play(env, policy, seed, max_steps, max_stall) for seed in seeds]
+            finally:
+                env.close()
+
+        workers = min(self.num_envs, max(1, len(seeds)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(policy, self.env_kwargs)) as pool:
+            return list(pool.map(_run_seed, seeds, [max_steps] * len(seeds), [max_stall] * len(seeds)))
+
+    def _run_batched(self, policy, seeds, max_steps, max_stall):
+        queue = list(enumerate(seeds))
+        results = [None] * len(queue)
+        episodes = [None] * self.num_envs
+        observations, infos = self._start(episodes, queue, np.ones(self.num_envs, dtype=bool))
+
+        while any(episode is not None for episode in episodes):
+            running = [env for env, episode in enumerate(episodes) if episode is not None]
+            actions = [NOOP_ACTION] * self.num_envs
+            step_start = time.perf_counter()
+            chosen = policy.get_actions(
+                [unbatch(self.envs.single_observation_space, observations, env) for env in running],
+                [unbatch_info(infos, env) for env in running],
+            )
+            latency = (time.perf_counter() - step_start) / len(running)
+            for env, action in zip(running, chosen):
+                actions[env] = action if None not in tuple(action["position"]) else NOOP_ACTION
+
+            observations, rewards, terminated, truncated, infos = self.envs.step(self._batch_actions(actions))
+
+            finished = np.zeros(self.num_envs, dtype=bool)
+            for env in running:
+                episode = episodes[env]
+                left = sum(int(prod["quantity"]) for prod in unbatch(self.envs.single_observation_space, observations, env)["products"])
+                episode["stall"] = episode["stall"] + 1 if left == episode["remaining"] else 0
+                episode["placed"] += episode["remaining"] - left
+                episode["remaining"] = left
+                episode["steps"] += 1
+                episode["latency"] += latency
+                if terminated[env] or truncated[env] or episode["steps"] >= max_steps or episode["stall"] >= max_stall:
+                    results[episode["index"]] = self._result(episode, observations, infos, env, bool(terminated[env]))
+                    episodes[env] = None
+                    finished[env] = True
+
+            if finished.any() and (queue or any(episode is not None for episode in episodes)):
+                observations, infos = self._start(episodes, queue, finished)
+
+        return results
+
+    def _start(self, episodes, queue, mask):
+        # Reset the masked envs with the next seeds of the queue. Envs left without a seed are reset too,
+        # because an env that has finished cannot be stepped again with autoreset disabled.
+        seeds = [None] * self.num_envs
+        for env in np.flatnonzero(mask):
+            if queue:
+                index, seed = queue.pop(0)
+                seeds[env] = seed
+                episodes[env] = {
+                    "index": index, "seed": seed, "steps": 0, "placed": 0, "stall": 0,
+                    "remaining": None, "latency": 0.0, "start": time.perf_counter(),
+                }
+
+        observations, infos = self.envs.reset(seed=seeds, options={"reset_mask": mask})
+        for env in np.flatnonzero(mask):
+            if episodes[env] is not None:
+                products = unbatch(self.envs.single_observation_space, observations, env)["products"]
+                episodes[env]["remaining"] = sum(int(prod["quantity"]) for prod in products)
+        return observations, infos
+
+    def _batch_actions(self, actions):
+        space = self.envs.single_action_space
+        return concatenate(space, actions, create_empty_array(space, self.num_envs))
+
+    def _result(self, episode, observations, infos, env, completed):
+        observation = unbatch(self.envs.single_observation_space, observations, env)
+        info = unbatch_info(infos, env)
+        return {
+            "seed": episode["seed"],
+            "completed": completed,
+            "steps": episode["steps"],
+            "placed": episode["placed"],
+            "wall_time": time.perf_counter() - episode["start"],
+            "policy_time": episode["latency"],
+            "filled_ratio": float(info.get("filled_ratio", np.nan)),
+            "trim_loss": float(info.get("trim_loss", np.nan)),
+            "stocks_used": int(sum(np.any(stock >= 0) for stock in observation["stocks"])),
+        }
+
+
+def main():
+    from benchmark import ORDERS, POLICIES
+
+    parser = argparse.ArgumentParser(description="Evaluate a policy on many seeds with vectorized environments.")
+    parser.add_argument("--policy", choices=list(POLICIES), default="ffd")
+    parser.add_argument("--order", choices=list(ORDERS), default="large")
+    parser.add_argument("--num-envs", type=int, default=os.cpu_count())
+    parser.add_argument("--seeds", nargs=2, type=int, default=[0, 100], metavar=("FIRST", "LAST"), help="seeds FIRST..LAST-1")
+    parser.add_argument("--sync", action="store_true", help="run the episodes in this process instead of worker processes")
+    args = parser.parse_args()
+
+    rollout = VectorRollout(args.num_envs, ORDERS[args.order], asynchronous=not args.sync)
+    policy = POLICIES[args.policy]()
+    start = time.perf_counter()
+    results = rollout.run(policy, range(*args.seeds))
+    elapsed = time.perf_counter() - start
+    rollout.close()
+
+    print(f"{len(results)} episodes with {args.num_envs} envs in {elapsed:.2f}s ({len(results) / elapsed:.2f} episodes/s)")
+    print(f"completed: {sum(result['completed'] for result in results)}/{len(results)}")
+    for key in ["steps", "trim_loss", "filled_ratio", "stocks_used"]:
+        print(f"mean {key}: {np.mean([result[key] for result in results]):.3f}")
+
+
+if __name__ == "__main__":
+    main()
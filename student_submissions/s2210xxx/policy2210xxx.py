@@ -1,13 +1,160 @@
-from policy import Policy
+import heapq
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+from policy import PlacementIndex, PlanCache, Policy, StockBitset, StockIndex, StockState
 import numpy as np
 from scipy.optimize import linprog
-import random
+
+import kernels
 #Width is the number of elements with -1 in one column, which means that the width is vertical, axis = 1
 #height is the number of elements with -1 in one row, which means that the height is horizontal, axis = 0
+
+
+class SolutionEvaluator:
+    """
+    Incremental version of evaluate_solution for simulated annealing.
+    Cuts are accepted in list order: a cut is accepted when its cells are free in the stocks and not used
+    by an earlier accepted cut, and the waste is the total area of the rejected cuts.
+    Each touched stock has one reusable owner buffer: -2 for cells that are not free in the stocks,
+    -1 for free cells and otherwise the index of the accepted cut that uses the cell.
+    """
+
+    def __init__(self, stocks):
+        self.stocks = stocks
+        self.owners = {}
+        self.solution = []
+        self.accepted = []
+        self.waste = 0
+
+    def reset(self, solution):
+        # Full evaluation, reusing the owner buffers of the previous solution
+        for stock_idx, owner in self.owners.items():
+            owner[...] = np.where(self.stocks[stock_idx] == -1, -1, -2)
+        self.solution = list(solution)
+        self.accepted = [False] * len(self.solution)
+        self.waste = sum(cut[3] * cut[4] for cut in self.solution)
+        self._settle(list(range(len(self.solution))))
+        return -self.waste
+
+    def update(self, solution, changed):
+        """
+        Move to a solution that differs from the current one only at the indices in changed,
+        and return its fitness. Calling it again with the previous solution undoes the move.
+        """
+        pending = []
+        for k in changed:
+            if self.accepted[k]:
+                self._release(k, pending)
+        for k in changed:
+            self.waste += solution[k][3] * solution[k][4] - self.solution[k][3] * self.solution[k][4]
+            self.solution[k] = solution[k]
+            pending.append(k)
+        self._settle(pending)
+        return -self.waste
+
+    def _owner(self, stock_idx):
+        owner = self.owners.get(stock_idx)
+        if owner is None:
+            owner = np.where(self.stocks[stock_idx] == -1, -1, -2).astype(np.int32)
+            self.owners[stock_idx] = owner
+        return owner
+
+    def _bounds(self, k):
+        # Same cells as the slice [x:x+width, y:y+height] used by evaluate_solution
+        stock_idx, x, y, width, height, rotated = self.solution[k]
+        shape = self.stocks[stock_idx].shape
+        x0, x1, _ = slice(x, x + width).indices(shape[0])
+        y0, y1, _ = slice(y, y + height).indices(shape[1])
+        return stock_idx, x0, max(x0, x1), y0, max(y0, y1)
+
+    def _settle(self, pending):
+        # Re-check rejected cuts in increasing index order. Accepting a cut evicts the later cuts
+        # that overlap it, which can free cells for other later cuts, so the heap only moves forward.
+        heapq.heapify(pending)
+        done = set()
+        while pending:
+            i = heapq.heappop(pending)
+            if i in done:
+                continue
+            done.add(i)
+            stock_idx, x0, x1, y0, y1 = self._bounds(i)
+            region = self._owner(stock_idx)[x0:x1, y0:y1]
+            if not np.all((region == -1) | (region > i)):
+                continue
+            for j in np.unique(region[region > i]).tolist():
+                self._release(j, pending)
+            region[...] = i
+            self.accepted[i] = True
+            self.waste -= self.solution[i][3] * self.solution[i][4]
+
+    def _release(self, j, pending):
+        # Reject cut j and queue the later rejected cuts that may now fit in its cells
+        stock_idx, x0, x1, y0, y1 = self._bounds(j)
+        self._owner(stock_idx)[x0:x1, y0:y1] = -1
+        self.accepted[j] = False
+        self.waste += self.solution[j][3] * self.solution[j][4]
+        for k in range(j + 1, len(self.solution)):
+            if self.accepted[k] or self.solution[k][0] != stock_idx:
+                continue
+            _, kx0, kx1, ky0, ky1 = self._bounds(k)
+            if kx0 < x1 and x0 < kx1 and ky0 < y1 and y0 < ky1:
+                heapq.heappush(pending, k)
+
+
+def _annealing_worker(shm_name, shape, dtype, products, params, seed, deadline):
+    """
+    Run one simulated annealing chain in a worker process.
+    The stocks are read from the shared memory block created by simulated_annealing, not pickled per task.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        stocks = tuple(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+        policy = Policy2312900_2310559_2420003_2312894_2312974(policy_id=2, seed=seed)
+        vars(policy).update(params)
+        result = policy._anneal_chain_(products, stocks, deadline)
+        del stocks
+        return result
+    finally:
+        shm.close()
+
+
+def _genetic_worker(shm_name, shape, dtype, units, orders, rotations):
+    """
+    Decode a chunk of the population of the genetic algorithm in a worker process.
+    The stocks are read from the shared memory block created by genetic_algorithm, not pickled per task.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        stocks = tuple(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+        policy = Policy2312900_2310559_2420003_2312894_2312974(policy_id=4)
+        layouts = policy._decode_population_(units, stocks, orders, rotations)
+        del stocks
+        return layouts
+    finally:
+        shm.close()
+
+
 class Policy2312900_2310559_2420003_2312894_2312974(Policy):
-    def __init__(self, policy_id=1):
-        assert policy_id in [1, 2], "Policy ID must be 1 or 2"
+    # Phases timed by enable_profiling, on top of the ones of the Policy class
+    profile_phases = Policy.profile_phases + (
+        "_first_fit_decreasing_", "_find_position_",
+        "simulated_annealing", "initialize_solution", "generate_neighbor", "evaluate_neighbor", "evaluate_solution",
+        "genetic_algorithm", "_decode_population_", "_population_fitness_",
+        "column_generation", "_solve_master_", "_price_patterns_", "make_plan",
+    )
+
+    def __init__(
+        self, policy_id=1, batch_plan=False, workers=None, time_budget=None, seed=None, plan_cache=None, anytime_budget=None
+    ):
+        assert policy_id in [1, 2, 3, 4], "Policy ID must be 1, 2, 3 or 4"
         self.policy_id = policy_id
+
+        #Every random choice comes from the generator of the policy (self.rng), seeded with seed
+        self.seed(seed)
         
         #Data initalization for Simulated Annealing
         self.initial_temperature = 100
@@ -15,79 +162,114 @@ class Policy2312900_2310559_2420003_2312894_2312974(Policy):
         self.max_iterations = 100
         self.restarts = 5
 
+        #The initial solution of a chain gives up on the products it could not place after
+        #init_max_attempts placement index lookups or init_time_limit seconds, see init_info.
+        self.init_max_attempts = 10000
+        self.init_time_limit = 1.0
+        self.init_info = None
+        
+        #Independent restarts (and the decoding of the genetic algorithm population) run in parallel
+        #on a process pool with this many workers (default: one per core).
+        #time_budget is the wall-clock limit in seconds of one simulated_annealing call, None for no limit.
+        self.workers = workers if workers is not None else min(self.restarts, os.cpu_count() or 1)
+        self.time_budget = time_budget
+        self._pool = None
+        self.anneal_info = None
+
+        #Anytime mode (policy_id 2): with anytime_budget seconds per get_action, simulated annealing improves
+        #the layout of the whole remaining order, starting from First Fit Decreasing, until the budget is spent.
+        #The best layout is kept from one call to the next. The statistics of the last call are stored in anytime_info,
+        #and anytime_unit_time is the running estimate of the decoding time of one unit, in seconds.
+        self.anytime_budget = anytime_budget
+        self.anytime_temperature = 0.05
+        self.anytime_info = None
+        self.anytime_unit_time = None
+        self._anytime_state = None
+
+        #Data initialization for Column Generation.
+        #The solver stops after cg_time_limit seconds or cg_max_iterations pricing rounds,
+        #and the statistics of the last solve are stored in solve_info.
+        self.cg_time_limit = 5.0
+        self.cg_max_iterations = 100
+        self.cg_min_fill = 0.85
+        self.solve_info = None
+
+        #Data initialization for the Genetic Algorithm.
+        #Every generation keeps the ga_elite best individuals and breeds the others by tournament selection,
+        #order crossover and mutation. The search stops after ga_generations generations or ga_time_limit seconds,
+        #and the statistics of the last search are stored in ga_info.
+        self.ga_population = 30
+        self.ga_generations = 50
+        self.ga_elite = 2
+        self.ga_tournament = 3
+        self.ga_mutation_rate = 0.3
+        self.ga_rotation_rate = 0.02
+        self.ga_time_limit = 5.0
+        self.ga_info = None
+
+        #Data initialization for batch planning.
+        #When batch_plan is True, the whole order is planned on the first call after a reset,
+        #and each get_action only pops the next action of the plan.
+        #Column Generation and the Genetic Algorithm always plan the whole order.
+        self.batch_plan = batch_plan or policy_id in [3, 4]
+        self._plan = deque()
+        self._plan_expected = None
+
+        #Plans already computed, by order. Pass a PlanCache to share it between policies
+        #or to keep it on disk, by default every policy has its own in-memory cache.
+        self.plan_cache = plan_cache if plan_cache is not None else PlanCache()
+
+        #Data initialization for pattern reuse in First Fit Decreasing.
+        #After a search places a product, the copies of the cut stacked above it in the same free rectangle are queued,
+        #and the next steps cut them without searching as long as the product is still ordered.
+        self.reuse_patterns = True
+        self._pattern = deque()
+        self._pattern_generation = None
+        self._product_order = None
+
 
     def get_action(self, observation, info):
-        # Id 1 for First Fit Decreasing implementation
-        if self.policy_id == 1:
-            #print("Products information before sorting: ", observation["products"])
-            
-            # Sort the products by size in descending order.
-            # sorted() function is a built-in function for sorting. For more information see the documentation.
-            products = sorted(observation["products"], key=lambda x: x["size"][0] * x["size"][1], reverse=True)
-            #print("Products information after sorting: ", products)
-            
-            #Take out the information about available stocks
-            stocks = observation["stocks"]
-            
-            # Iterate through the products
-            for product in products:
-                
-                # If the quantity of current product is greater than 0,
-                # continue to insert it into the stocks
-                if product["quantity"] > 0:
-                    
-                    # Get the size of the current product
-                    prod_size = product["size"]
-                    
-                    # Iterate through all available stocks.
-                    # Iterate using enumerate() to get both the index and the stock,
-                    # See the document for information.
-                    for stock_idx, stock in enumerate(stocks):
-                        
-                        # Get the size of the current stock
-                        stock_w, stock_h = self._get_stock_size_(stock)
-                        
-                        # Get the size of the current product into two variables
-                        prod_w, prod_h = prod_size
+        # Batch planning mode: replay the plan as long as the env follows it,
+        # and compute a new plan for the whole order otherwise (new order, reset, rejected action).
+        if self.batch_plan:
+            if not self._plan_matches_(observation):
+                self._plan = deque(self.make_plan(observation))
+            if self._plan:
+                action, expected_products = self._plan.popleft()
+                self._plan_expected = (action, expected_products)
+                return action
+            # If the plan could not place everything, the remaining products are handled step by step below
 
-                        # Initial condition: The size of the product must be less than or equal to the size of the stock.
-                        if stock_w >= prod_w and stock_h >= prod_h:
-                            
-                            # Iterate through all possible indexes in the x coordinate where we can put 
-                            # the top-left corner of the product.
-                            for x in range(stock_w - prod_w + 1):
-                                
-                                # Inner loop to iterate through all possible indexes in the y coordinate where we can put
-                                # the bootom-right corner of the product.
-                                for y in range(stock_h - prod_h + 1):
-                                    
-                                    # Check if the product can be placed at the current position
-                                    # If yes, return the information for the environment to place the product.
-                                    if self._can_place_(stock, (x, y), prod_size):
-                                        
-                                        # Necessary datas for the environment to place the product,
-                                        # including: the index of the stock that we insert the new product,
-                                        # the size of the product, and the position of the top-left corner of the product.
-                                        return {"stock_idx": stock_idx, "size": prod_size, "position": (x, y)}
-
-                        # else, rotate the product and check if it can fit into the stock
-                        if stock_w >= prod_h and stock_h >= prod_w:
-                            for x in range(stock_w - prod_h + 1):
-                                for y in range(stock_h - prod_w + 1):
-                                    
-                                    # The slicing notation [::-1] is used to reverse the order of the elements in the list,
-                                    # which means that the width and height of the product size are swapped.
-                                    if self._can_place_(stock, (x, y), prod_size[::-1]):
-                                        return {"stock_idx": stock_idx, "size": prod_size[::-1], "position": (x, y)}
+        # Id 1 for First Fit Decreasing implementation.
+        # Column Generation (id 3) and the Genetic Algorithm (id 4) also use it for the products their plan could not place.
+        if self.policy_id in [1, 3, 4]:
+            # Cached size, free area and placement index of every stock.
+            # The cache is updated from the previous action instead of rescanning all stocks.
+            stock_states = self._get_stock_states_(observation)
+            
+            # Next copy of the last pattern, or a new search
+            action = self._next_pattern_copy_(observation["products"], stock_states)
+            if action is None:
+                action = self._first_fit_decreasing_(
+                    observation["products"], observation["stocks"], stock_states, stock_index=self._get_stock_index_()
+                )
+                if action is not None and self.reuse_patterns:
+                    self._pattern = deque(self._tile_pattern_(action, observation["products"], stock_states[action["stock_idx"]]))
+                    self._pattern_generation = self._stock_cache.generation
+            if action is not None:
+                return self._record_action_(action)
 
             # If no valid position is found, return a dummy action
             return {"stock_idx": 0, "size": [0, 0], "position": (0, 0)}
         
-        # Id 2 for Genetic Algorithm Implementation
+        # Id 2 for Simulated Annealing implementation
         elif self.policy_id == 2:
             """
             Get the best action for the current observation using simulated annealing.
             """
+            if self.anytime_budget is not None:
+                return self._anytime_action_(observation)
+
             products = observation["products"]
             stocks = observation["stocks"]
             best_solution = self.simulated_annealing(products, stocks)
@@ -101,6 +283,135 @@ class Policy2312900_2310559_2420003_2312894_2312974(Policy):
                 best_action = {"stock_idx": 0, "size": [0, 0], "position": (0, 0), "rotated": False}
             return best_action
 
+    ##################################
+    #Helping functions for First Fit Decreasing
+    def _first_fit_decreasing_(self, products, stocks, stock_states, stock_order=None, stock_index=None):
+        #print("Products information before sorting: ", products)
+        
+        # The stock index of stock_states selects the stocks that can hold a product without trying them all
+        if stock_index is None:
+            stock_index = StockIndex(stock_states)
+        
+        # Sort the products by size in descending order.
+        # The order only depends on the product sizes, so it is computed once per order (see _product_order_).
+        order = self._product_order_(products)
+        #print("Products information after sorting: ", products)
+        
+        # Sizes already tried: products of the same size fit in the same places, so the search runs once per size
+        tried = set()
+        
+        # Iterate through the products
+        for product in (products[prod_idx] for prod_idx in order):
+            
+            # If the quantity of current product is greater than 0,
+            # continue to insert it into the stocks
+            if product["quantity"] > 0:
+                
+                # Get the size of the current product
+                prod_size = product["size"]
+                if (int(prod_size[0]), int(prod_size[1])) in tried:
+                    continue
+                tried.add((int(prod_size[0]), int(prod_size[1])))
+                
+                # Iterate through the stocks that can hold the product, in index order unless another order is given.
+                for stock_idx in stock_index.candidates(prod_size, stock_order):
+                    stock = stocks[stock_idx]
+                    
+                    # Get the size of the current stock
+                    stock_w, stock_h = stock_states[stock_idx].size
+                    
+                    # Get the size of the current product into two variables
+                    prod_w, prod_h = prod_size
+
+                    # Placement index of the current stock, shared by both orientations
+                    index = stock_states[stock_idx].index
+
+                    # Initial condition: The size of the product must be less than or equal to the size of the stock,
+                    # and one of the free rectangles of the stock must be able to hold it.
+                    if stock_w >= prod_w and stock_h >= prod_h and stock_index.fits(stock_idx, prod_size):
+                        
+                        # Find the first top-left corner (smallest x, then smallest y) where the product fits.
+                        # The summed-area table answers this in one vectorized pass instead of
+                        # calling _can_place_ for every (x, y).
+                        position = self._find_position_(stock, prod_size, index)
+                        if position is not None:
+                            
+                            # Necessary datas for the environment to place the product,
+                            # including: the index of the stock that we insert the new product,
+                            # the size of the product, and the position of the top-left corner of the product.
+                            return {"stock_idx": stock_idx, "size": prod_size, "position": position}
+
+                    # else, rotate the product and check if it can fit into the stock
+                    if stock_w >= prod_h and stock_h >= prod_w and stock_index.fits(stock_idx, prod_size[::-1]):
+                        
+                        # The slicing notation [::-1] is used to reverse the order of the elements in the list,
+                        # which means that the width and height of the product size are swapped.
+                        position = self._find_position_(stock, prod_size[::-1], index)
+                        if position is not None:
+                            return {"stock_idx": stock_idx, "size": prod_size[::-1], "position": position}
+
+        # No product fits anywhere
+        return None
+
+    def _product_order_(self, products):
+        # Indices of the products by decreasing area (stable, like sorted), cached while the sizes stay the same
+        sizes = tuple((int(prod["size"][0]), int(prod["size"][1])) for prod in products)
+        if self._product_order is None or self._product_order[0] != sizes:
+            order = sorted(range(len(sizes)), key=lambda i: sizes[i][0] * sizes[i][1], reverse=True)
+            self._product_order = (sizes, order)
+        return self._product_order[1]
+
+    def _tile_pattern_(self, action, products, state):
+        """
+        Copies of the cut of action stacked above it (increasing y, same x) in the free rectangle of state
+        it starts in, which are exactly the next cuts of First Fit Decreasing: the product still comes first
+        in its order, and every position with a smaller x, or the same x and a smaller y, is still taken.
+        Copies in the next columns are not queued, since First Fit Decreasing may put them elsewhere.
+        Among the free rectangles that contain the cut, the one holding the most copies above it is used.
+        There are at most as many copies as the quantity of the product it cut and of the products of the
+        same size right after it in its order, since First Fit Decreasing picks one of them at every step
+        until they run out.
+        """
+        x, y = int(action["position"][0]), int(action["position"][1])
+        width, height = int(action["size"][0]), int(action["size"][1])
+        # The product First Fit Decreasing cut is the first of this size (in any orientation) in its order
+        quantity, size = 0, None
+        for prod in (products[prod_idx] for prod_idx in self._product_order_(products)):
+            if prod["quantity"] <= 0:
+                continue
+            prod_size = (int(prod["size"][0]), int(prod["size"][1]))
+            if size is None:
+                if prod_size not in [(width, height), (height, width)]:
+                    continue
+                size = prod_size
+            elif prod_size != size:
+                break
+            quantity += int(prod["quantity"])
+        if quantity <= 1:
+            return []
+
+        rows = 1
+        for rect_x, rect_y, rect_w, rect_h in state.free_rects.rects:
+            if rect_x <= x and rect_y <= y and x + width <= rect_x + rect_w and y + height <= rect_y + rect_h:
+                rows = max(rows, (rect_y + rect_h - y) // height)
+
+        positions = [(x, y + j * height) for j in range(1, min(rows, quantity))]
+        return [{"stock_idx": action["stock_idx"], "size": action["size"], "position": position} for position in positions]
+
+    def _next_pattern_copy_(self, products, stock_states):
+        # The next queued copy, if the stocks were not rebuilt since it was queued, its product is still
+        # ordered and its cells are still free. Otherwise the pattern is dropped.
+        if not self._pattern or self._pattern_generation != self._stock_cache.generation:
+            self._pattern.clear()
+            return None
+        action = self._pattern.popleft()
+        if self._find_product_(products, action["size"]) is None or not stock_states[action["stock_idx"]].bits.is_free(
+            action["position"], action["size"]
+        ):
+            self._pattern.clear()
+            return None
+        return action
+
     ##################################
     #Helping functions for First Fit Decreasing
     def _get_stock_size_(self, stock):
@@ -111,6 +422,10 @@ class Policy2312900_2310559_2420003_2312894_2312974(Policy):
     def _can_place_(self, stock, position, size):
         # Check if the product can be placed at the given position
         
+        # Occupancy bits (e.g. StockState.bits) answer with one AND per row
+        if isinstance(stock, StockBitset):
+            return stock.is_free(position, size)
+
         # Get the x and y coordinates of the top-left corner of the product
         pos_x, pos_y = position
         
@@ -120,6 +435,9 @@ class Policy2312900_2310559_2420003_2312894_2312974(Policy):
         # As the "stocks" key of the observation is a list of 2D numpy arrays,
         # we check using the dimension of the stock and the position of the product
         if pos_x + width <= stock.shape[0] and pos_y + height <= stock.shape[1]:
+            if pos_x >= 0 and pos_y >= 0:
+                # Compiled loop with an early exit when numba is installed, see kernels.py
+                return kernels.rect_free(stock, pos_x, pos_y, width, height)
             if np.all(stock[pos_x:pos_x + width, pos_y:pos_y + height] == -1):
                 return True
         return False
@@ -134,110 +452,1073 @@ class Policy2312900_2310559_2420003_2312894_2312974(Policy):
     def simulated_annealing(self, products, stocks):
         """
         Main Simulated Annealing algorithm.
+        Runs self.restarts independent chains with different seeds and returns the best solution.
+        With more than one worker, the first chain runs in this process and the other chains run in parallel
+        only when it leaves waste. After self.time_budget seconds every chain returns its best solution so far.
+        """
+        deadline = time.time() + self.time_budget if self.time_budget is not None else None
+        restarts = max(1, self.restarts)
+        # Every chain has its own seed drawn from the policy generator, wherever it runs
+        seeds = [int(seed) for seed in self.rng.integers(2**32, size=restarts)]
+
+        # With the pool, only the first chain runs here. The pool is used only when that chain leaves waste,
+        # since later chains cannot beat a solution without waste.
+        parallel = restarts > 1 and self.workers > 1 and len({stock.shape for stock in stocks}) == 1
+        results = []
+        rng = self._rng
+        try:
+            for seed in seeds[:1] if parallel else seeds:
+                self.seed(seed)
+                results.append(self._anneal_chain_(products, stocks, deadline))
+                if results[-1][1] == 0 or (deadline is not None and time.time() >= deadline):
+                    break
+            else:
+                if parallel:
+                    results += self._parallel_chains_(products, stocks, seeds[1:], deadline)
+        finally:
+            self._rng = rng
+
+        # The first chain (in seed order) with the best fitness wins, wherever the chains ran
+        best_solution, best_fitness, _ = max(results, key=lambda result: result[1])
+        self.anneal_info = {"chains": len(results), "iterations": sum(result[2] for result in results), "fitness": best_fitness}
+        return best_solution
+
+    def _parallel_chains_(self, products, stocks, seeds, deadline):
+        # Copy the stocks once into shared memory, every worker reads them from there
+        array = np.stack(stocks)
+        shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+        try:
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            products = [{"size": np.array(prod["size"]), "quantity": int(prod["quantity"])} for prod in products]
+            params = {
+                "initial_temperature": self.initial_temperature,
+                "cooling_rate": self.cooling_rate,
+                "max_iterations": self.max_iterations,
+                "init_max_attempts": self.init_max_attempts,
+                "init_time_limit": self.init_time_limit,
+            }
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            futures = [
+                self._pool.submit(_annealing_worker, shm.name, array.shape, array.dtype, products, params, seed, deadline)
+                for seed in seeds
+            ]
+
+            # Chains stop themselves at the deadline. Chains that have not even started by then are dropped,
+            # but at least one chain is always waited for.
+            timeout = max(0.0, deadline - time.time()) if deadline is not None else None
+            done, not_done = wait(futures, timeout=timeout)
+            if not done:
+                done, not_done = wait(futures, return_when=FIRST_COMPLETED)
+            for future in not_done:
+                future.cancel()
+            wait([future for future in not_done if future.running()])
+            # In the order of the seeds, so that ties are broken like in the serial loop
+            return [future.result() for future in futures if future in done]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        # Shut down the annealing process pool
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def __getstate__(self):
+        # The process pool cannot be pickled or copied, the copy creates its own when needed
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
+
+    def _anneal_chain_(self, products, stocks, deadline=None):
         """
-        current_solution = self.initialize_solution(products, stocks)
-        current_fitness = self.evaluate_solution(current_solution, stocks)
+        One simulated annealing chain, stopped early at the deadline (time.time() value) if given,
+        and right away when the solution has no waste.
+        The chain starts from initialize_solution.
+        Returns the best solution of the chain, its fitness and the number of iterations done.
+        """
+        current_solution = self.initialize_solution(products, stocks, deadline)
+        
+        # The evaluator scores each neighbor from the cuts that changed instead of copying all stocks
+        evaluator = SolutionEvaluator(stocks)
+        current_fitness = evaluator.reset(current_solution)
         best_solution = current_solution
         best_fitness = current_fitness
 
+        # 0 (no waste) is the best fitness, which no neighbor can improve on
+        if current_fitness == 0:
+            return best_solution, best_fitness, 0
+
         temperature = self.initial_temperature
 
+        iterations = 0
         for iteration in range(self.max_iterations):
+            if deadline is not None and time.time() >= deadline:
+                break
+            iterations += 1
             neighbor = self.generate_neighbor(current_solution, products, stocks)
-            neighbor_fitness = self.evaluate_solution(neighbor, stocks)
+            changed = [k for k, (old, new) in enumerate(zip(current_solution, neighbor)) if old != new]
+            neighbor_fitness = self.evaluate_neighbor(evaluator, neighbor, changed)
 
             # Accept neighbor with probability
             delta = neighbor_fitness - current_fitness
-            if delta > 0 or random.uniform(0, 1) < np.exp(delta / temperature):
+            if delta > 0 or self.rng.random() < np.exp(delta / temperature):
                 current_solution = neighbor
                 current_fitness = neighbor_fitness
 
                 if current_fitness > best_fitness:
                     best_solution = current_solution
                     best_fitness = current_fitness
+            else:
+                # Rejected: move the evaluator back to the current solution
+                self.evaluate_neighbor(evaluator, current_solution, changed)
 
             # Cool down
             temperature *= self.cooling_rate
 
-        return best_solution
-    
+        return best_solution, best_fitness, iterations
+
+    def _anytime_action_(self, observation):
+        """
+        Anytime simulated annealing over the whole remaining order, answering within anytime_budget seconds.
+        A solution is a chromosome of the genetic algorithm (order and rotation of the units), decoded by
+        _decode_population_ and scored by _population_fitness_: unplaced area, stocks used, then trim loss.
+        The search starts from the best chromosome and layout of the previous call without the unit that was
+        cut, or from the First Fit Decreasing order, so improvements carry over from one call to the next.
+        The units of that layout that were not decoded before the deadline of an earlier call are decoded
+        first, up to the deadline. A neighbor that is not worse is accepted, a neighbor with the same unplaced
+        area and stocks but a higher trim loss is accepted with probability exp(-increase / temperature), and
+        anything else is rejected. A neighbor is only decoded when the running estimate of its decoding time
+        (anytime_unit_time per unit) fits before the deadline.
+        The action is the first cut of the best layout.
+        """
+        start = time.time()
+        deadline = start + self.anytime_budget
+        products = observation["products"]
+        stocks = observation["stocks"]
+        stock_states = self._get_stock_states_(observation)
+
+        units = self._order_units_(products)
+        if len(units) == 0:
+            self._anytime_state = None
+            self.anytime_info = {"iterations": 0, "warm": False, "improved": False, "fitness": None, "elapsed": time.time() - start}
+            return {"stock_idx": 0, "size": [0, 0], "position": (0, 0)}
+
+        order, rotation, layout, warm = self._anytime_start_(units, products)
+        if np.any(layout[:, 0] == -2):
+            layout = self._decode_population_(
+                units, stocks, order[None], rotation[None], stock_states, layout[None], deadline
+            )[0]
+        fitness = tuple(self._population_fitness_(units, stock_states, layout[None])[0].tolist())
+        start_fitness = fitness
+        best = (order, rotation, layout, fitness)
+
+        temperature = self.anytime_temperature
+        iterations = 0
+        while best[3][0] + best[3][2] > 0:
+            began = time.time()
+            if began + (self.anytime_unit_time or 0.0) * len(units) >= deadline:
+                break
+            iterations += 1
+            neighbor_order, neighbor_rotation = self._mutate_chromosome_(order, rotation)
+            neighbor_layout = self._decode_population_(
+                units, stocks, neighbor_order[None], neighbor_rotation[None], stock_states, deadline=deadline
+            )[0]
+            # Running estimate of the decoding time per unit, which follows a slower decoding at once
+            # and a faster one gradually. Decodings stopped by the deadline count with the units they reached.
+            unit_time = (time.time() - began) / max(1, np.count_nonzero(neighbor_layout[:, 0] != -2))
+            if self.anytime_unit_time is None or unit_time > self.anytime_unit_time:
+                self.anytime_unit_time = unit_time
+            else:
+                self.anytime_unit_time = 0.8 * self.anytime_unit_time + 0.2 * unit_time
+            neighbor_fitness = tuple(self._population_fitness_(units, stock_states, neighbor_layout[None])[0].tolist())
+
+            if neighbor_fitness <= fitness or (
+                neighbor_fitness[:2] == fitness[:2]
+                and self.rng.random() < np.exp((fitness[2] - neighbor_fitness[2]) / temperature)
+            ):
+                order, rotation, fitness = neighbor_order, neighbor_rotation, neighbor_fitness
+                if fitness < best[3]:
+                    best = (order, rotation, neighbor_layout, fitness)
+            temperature *= self.cooling_rate
+
+        order, rotation, layout, fitness = best
+        placed = np.flatnonzero(layout[:, 0] >= 0)
+        action = {"stock_idx": 0, "size": [0, 0], "position": (0, 0)}
+        self._anytime_state = None
+        if placed.size > 0:
+            k = int(placed[0])
+            stock_idx, x, y, width, height = layout[k].tolist()
+            action = {"stock_idx": stock_idx, "size": (width, height), "position": (x, y)}
+            # The next call starts from the same chromosome and layout without this unit, which stay valid
+            # once the environment has cut it
+            rest = np.delete(order, k)
+            expected = [[int(prod["size"][0]), int(prod["size"][1]), int(prod["quantity"])] for prod in products]
+            expected[self._find_product_(products, (width, height))][2] -= 1
+            self._anytime_state = (
+                [tuple(units[unit]) for unit in rest.tolist()],
+                rotation[rest].tolist(),
+                np.delete(layout, k, axis=0),
+                tuple(map(tuple, expected)),
+                self._stock_cache.generation,
+            )
+
+        self.anytime_info = {
+            "iterations": iterations,
+            "warm": warm,
+            "improved": fitness < start_fitness,
+            "fitness": {"unplaced_area": int(fitness[0]), "stocks_used": int(fitness[1]), "trim_loss": fitness[2]},
+            "elapsed": time.time() - start,
+        }
+        return self._record_action_(action)
+
+    def _anytime_start_(self, units, products):
+        # Chromosome and layout of the previous call when the environment followed it (same products left
+        # and stock states carried over), the First Fit Decreasing order with nothing decoded otherwise
+        state = self._anytime_state
+        if state is not None and self._products_key_(products) == state[3] and self._stock_cache.generation == state[4]:
+            free_units = {}
+            for unit, size in enumerate(units.tolist()):
+                free_units.setdefault(tuple(size), []).append(unit)
+            order = [free_units[size].pop() for size in state[0]]
+            rotation = np.zeros(len(units), dtype=bool)
+            rotation[order] = state[1]
+            return np.array(order, dtype=np.int64), rotation, state[2], True
+        order, rotation = self._initial_population_(units, 1)
+        layout = np.full((len(units), 5), -1, dtype=np.int64)
+        layout[:, 0] = -2
+        return order[0], rotation[0], layout, False
+
+    def _mutate_chromosome_(self, order, rotation):
+        # Neighbor of a chromosome: swap two units, reverse a segment or flip the rotation of one unit
+        order, rotation = order.copy(), rotation.copy()
+        move = self.rng.random()
+        if move < 0.4 and len(order) > 1:
+            i, j = self.rng.choice(len(order), size=2, replace=False)
+            order[i], order[j] = order[j], order[i]
+        elif move < 0.7 and len(order) > 1:
+            i, j = np.sort(self.rng.choice(len(order), size=2, replace=False))
+            order[i : j + 1] = order[i : j + 1][::-1]
+        else:
+            unit = int(self.rng.integers(len(rotation)))
+            rotation[unit] = not rotation[unit]
+        return order, rotation
+
     def generate_neighbor(self, solution, products, stocks):
         """
         Generate a neighbor solution by intelligently modifying one cut.
         """
         neighbor = solution.copy()
-        idx = random.randint(0, len(neighbor) - 1)
-        product = products[idx]
-        width, height = product['size']
-        stock_idx = random.randint(0, len(stocks) - 1)
+        if not neighbor:
+            return neighbor
+        idx = int(self.rng.integers(len(neighbor)))
+
+        # Size of the product of this cut, before its own rotation. Cuts are not aligned with products
+        # (products with quantity 0 or that could not be placed have no cut), so it comes from the cut.
+        _, _, _, width, height, rotated = neighbor[idx]
+        if rotated:
+            width, height = height, width
+        stock_idx = int(self.rng.integers(len(stocks)))
         stock_w, stock_h = self._get_stock_size_(stocks[stock_idx])
 
         # Randomly decide whether to rotate the product
-        if random.random() < 0.5:
+        if self.rng.random() < 0.5:
             width, height = height, width
             rotated = True
         else:
             rotated = False
 
         # Localized adjustments: small shifts in x and y coordinates
-        shift_x = random.randint(-1, 1)
-        shift_y = random.randint(-1, 1)
+        shift_x = int(self.rng.integers(-1, 2))
+        shift_y = int(self.rng.integers(-1, 2))
         x = max(0, min(stock_w - width, neighbor[idx][1] + shift_x))
         y = max(0, min(stock_h - height, neighbor[idx][2] + shift_y))
 
         # Edge and corner placement
-        if random.random() < 0.3:
-            if random.random() < 0.5:
-                x = 0 if random.random() < 0.5 else stock_w - width
+        if self.rng.random() < 0.3:
+            if self.rng.random() < 0.5:
+                x = 0 if self.rng.random() < 0.5 else stock_w - width
             else:
-                y = 0 if random.random() < 0.5 else stock_h - height
+                y = 0 if self.rng.random() < 0.5 else stock_h - height
 
         # Swap positions with another product
-        if random.random() < 0.2:
-            swap_idx = random.randint(0, len(neighbor) - 1)
+        if self.rng.random() < 0.2:
+            swap_idx = int(self.rng.integers(len(neighbor)))
             neighbor[idx], neighbor[swap_idx] = neighbor[swap_idx], neighbor[idx]
         else:
             neighbor[idx] = (stock_idx, x, y, width, height, rotated)
 
         return neighbor
     
+    def evaluate_neighbor(self, evaluator, solution, changed):
+        # Fitness of a solution that differs from the evaluator's last one in the cuts listed in changed
+        return evaluator.update(solution, changed)
+
     def evaluate_solution(self, solution, stocks):
         """
         Evaluate a solution based on waste and feasibility.
+        This is the full evaluation, simulated_annealing uses the incremental SolutionEvaluator.
+        Cuts use the same [x:x+width, y:y+height] indexing as _can_place_ and the environment.
+        stocks are either the grids, scored by kernels.overlap_waste, or their StockBitset,
+        which are copied instead of the grids.
         """
-        used_stocks = np.copy(stocks)
+        if not any(isinstance(stock, StockBitset) for stock in stocks):
+            free, cuts = self._solution_arrays_([solution], stocks)
+            return -int(kernels.overlap_waste(free, cuts)[0])
+
+        used_stocks = [
+            stock.copy() if isinstance(stock, StockBitset) else StockBitset.from_stock(stock) for stock in stocks
+        ]
         waste = 0
         for stock_idx, x, y, width, height, rotated in solution:
-            if np.all(used_stocks[stock_idx][y:y+height, x:x+width] == -1):
-                used_stocks[stock_idx][y:y+height, x:x+width] = 1  # Mark as used
+            # Clip the cut the way the slice [x:x+width, y:y+height] of the grid would
+            shape = used_stocks[stock_idx].shape
+            x0, x1, _ = slice(x, x + width).indices(shape[0])
+            y0, y1, _ = slice(y, y + height).indices(shape[1])
+            cells = (max(0, x1 - x0), max(0, y1 - y0))
+            if used_stocks[stock_idx].is_free((x0, y0), cells):
+                used_stocks[stock_idx].mark((x0, y0), cells)  # Mark as used
             else:
                 waste += width * height  # Penalize overlap
         return -waste  # Higher fitness for lower waste
+
+    def _solution_arrays_(self, solutions, stocks):
+        """
+        Inputs of kernels.overlap_waste for solutions with the same number of cuts: the free cells of
+        the stocks they touch, and their cuts as (slot, x0, y0, x1, y1, area) rows, clipped the way
+        the slice [x:x+width, y:y+height] of the grid would be.
+        """
+        touched = sorted({cut[0] for solution in solutions for cut in solution})
+        slots = {stock_idx: slot for slot, stock_idx in enumerate(touched)}
+        shape = (
+            max((stocks[stock_idx].shape[0] for stock_idx in touched), default=0),
+            max((stocks[stock_idx].shape[1] for stock_idx in touched), default=0),
+        )
+        free = np.zeros((len(touched),) + shape, dtype=bool)
+        for stock_idx, slot in slots.items():
+            stock = stocks[stock_idx]
+            free[slot, : stock.shape[0], : stock.shape[1]] = stock == -1
+
+        cuts = np.zeros((len(solutions), len(solutions[0]) if solutions else 0, 6), dtype=np.int64)
+        for b, solution in enumerate(solutions):
+            for k, (stock_idx, x, y, width, height, rotated) in enumerate(solution):
+                stock_shape = stocks[stock_idx].shape
+                x0, x1, _ = slice(x, x + width).indices(stock_shape[0])
+                y0, y1, _ = slice(y, y + height).indices(stock_shape[1])
+                cuts[b, k] = (slots[stock_idx], x0, y0, max(x0, x1), max(y0, y1), width * height)
+        return free, cuts
     
-    def initialize_solution(self, products, stocks):
+    def initialize_solution(self, products, stocks, deadline=None):
         """
         Generate an initial random solution.
-        Each solution is a list of cuts representing (stock_idx, x, y, width, height, rotated).
+        Each solution is a list of cuts representing (stock_idx, x, y, width, height, rotated),
+        one cut for every product with quantity > 0 that could be placed.
+        Every product only tries the stocks that can hold it in either orientation, and takes a random free
+        position from the placement index of the stock, so no attempt is wasted on a taken position.
+        Cuts do not overlap each other. The search stops after init_max_attempts placement index lookups,
+        init_time_limit seconds or the deadline (time.time() value), and the products that are not placed
+        are listed in init_info["unplaced"].
         """
+        limit = time.time() + self.init_time_limit
+        deadline = limit if deadline is None else min(deadline, limit)
+        sizes = [self._get_stock_size_(stock) for stock in stocks]
+        indexes = {}
+        attempts = 0
+
         solution = []
-        for product in products:
+        unplaced = []
+        for prod_idx, product in enumerate(products):
             if product["quantity"] == 0:
                 continue
-            width, height = product['size']
+            width, height = int(product["size"][0]), int(product["size"][1])
+
+            # Stocks that can hold the product, in both orientations, in random order
+            candidates = [
+                (stock_idx, w, h, rotated)
+                for stock_idx, (stock_w, stock_h) in enumerate(sizes)
+                for w, h, rotated in [(width, height, False), (height, width, True)][: 1 if width == height else 2]
+                if stock_w >= w and stock_h >= h
+            ]
             placed = False
-            while not placed:
-                stock_idx = random.randint(0, len(stocks) - 1)
-                stock_w, stock_h = self._get_stock_size_(stocks[stock_idx])
-                if stock_w >= width and stock_h >= height:
-                    x = random.randint(0, stock_w - width)
-                    y = random.randint(0, stock_h - height)
-                    if self._can_place_(stocks[stock_idx], (x, y), (width, height)):
-                        solution.append((stock_idx, x, y, width, height, False))
-                        placed = True
-                elif stock_w >= height and stock_h >= width:
-                    x = random.randint(0, stock_w - height)
-                    y = random.randint(0, stock_h - width)
-                    if self._can_place_(stocks[stock_idx], (x, y), (height, width)):
-                        solution.append((stock_idx, x, y, height, width, True))
+            for candidate in self.rng.permutation(len(candidates)):
+                if attempts >= self.init_max_attempts or time.time() >= deadline:
+                    break
+                attempts += 1
+                stock_idx, w, h, rotated = candidates[candidate]
+                if stock_idx not in indexes:
+                    indexes[stock_idx] = PlacementIndex(stocks[stock_idx])
+                mask = indexes[stock_idx].feasible((w, h))
+                hits = np.flatnonzero(mask)
+                if hits.size > 0:
+                    x, y = divmod(int(hits[self.rng.integers(hits.size)]), mask.shape[1])
+                    indexes[stock_idx].mark((x, y), (w, h))
+                    solution.append((stock_idx, x, y, w, h, rotated))
+                    placed = True
+                    break
+            if not placed:
+                unplaced.append(prod_idx)
+
+        self.init_info = {"placed": len(solution), "unplaced": unplaced, "attempts": attempts}
+        return solution
+
+    ##################################
+    #Helping functions for Genetic Algorithm
+    def genetic_algorithm(self, products, stocks, stock_states):
+        """
+        Genetic algorithm over the whole order.
+        A chromosome is a permutation of the units of the order (one unit per product copy) and one rotation
+        bit per unit. It is decoded by cutting the units in permutation order, each at the first free position
+        (smallest x, then smallest y) of the first stock that can hold it, in its preferred orientation first.
+        The fitness of the whole population is computed at once by _population_fitness_.
+        Returns the cuts of the best individual as actions, in the order they have to be cut.
+        """
+        start = time.time()
+        deadline = start + self.ga_time_limit if self.ga_time_limit is not None else None
+        units = self._order_units_(products)
+        if len(units) == 0:
+            self.ga_info = {"generations": 0, "decoded": 0, "fitness": None, "elapsed": time.time() - start}
+            return []
+
+        # Copy the stocks once into shared memory when the decoding runs on the process pool
+        population_size = max(2, self.ga_population)
+        shm = None
+        if self.workers > 1 and population_size >= 2 * self.workers and len({stock.shape for stock in stocks}) == 1:
+            array = np.stack(stocks)
+            shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        try:
+            orders, rotations = self._initial_population_(units, population_size)
+            layouts = self._decode_batch_(units, stocks, stock_states, orders, rotations, shm)
+            fitness = self._population_fitness_(units, stock_states, layouts)
+            decoded = len(orders)
+            generations = 0
+            elite = min(max(1, self.ga_elite), population_size - 1)
+            while generations < self.ga_generations and (deadline is None or time.time() < deadline):
+                ranking = np.lexsort(fitness.T[::-1])
+                keep = ranking[:elite]
+                child_orders, child_rotations = self._breed_(orders, rotations, ranking, population_size - elite)
+                child_layouts = self._decode_batch_(units, stocks, stock_states, child_orders, child_rotations, shm)
+
+                # The elite keep their layouts and fitness, only the children are decoded and scored
+                orders = np.concatenate([orders[keep], child_orders])
+                rotations = np.concatenate([rotations[keep], child_rotations])
+                layouts = np.concatenate([layouts[keep], child_layouts])
+                fitness = np.concatenate([fitness[keep], self._population_fitness_(units, stock_states, child_layouts)])
+                decoded += len(child_orders)
+                generations += 1
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+        best = int(np.lexsort(fitness.T[::-1])[0])
+        unplaced_area, stocks_used, trim_loss = fitness[best].tolist()
+        self.ga_info = {
+            "generations": generations,
+            "decoded": decoded,
+            "fitness": {"unplaced_area": int(unplaced_area), "stocks_used": int(stocks_used), "trim_loss": trim_loss},
+            "elapsed": time.time() - start,
+        }
+        return [
+            {"stock_idx": stock_idx, "size": (width, height), "position": (x, y)}
+            for stock_idx, x, y, width, height in layouts[best].tolist()
+            if stock_idx >= 0
+        ]
+
+    def _order_units_(self, products):
+        # (width, height) of every unit of the order, one row per product copy, in the order of the products
+        return np.array(
+            [(int(prod["size"][0]), int(prod["size"][1])) for prod in products for _ in range(int(prod["quantity"]))],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+
+    def _initial_population_(self, units, population_size):
+        # The first individuals are the units sorted by decreasing area (the order of First Fit Decreasing),
+        # longest side, width and height, the others are copies of the area order with a few random swaps
+        # and rotations
+        area = units[:, 0] * units[:, 1]
+        keys = [area, units.max(axis=1), units[:, 0], units[:, 1]]
+        orders = [np.argsort(-key, kind="stable") for key in keys][:population_size]
+        rotations = [np.zeros(len(units), dtype=bool) for _ in orders]
+        while len(orders) < population_size:
+            order = orders[0].copy()
+            for _ in range(int(self.rng.integers(1, max(2, len(units) // 10) + 1))):
+                i, j = self.rng.integers(len(units), size=2)
+                order[i], order[j] = order[j], order[i]
+            orders.append(order)
+            rotations.append(self.rng.random(len(units)) < 0.1)
+        return np.array(orders), np.array(rotations)
+
+    def _breed_(self, orders, rotations, ranking, count):
+        """
+        count children of the population. Parents are chosen by tournaments of ga_tournament individuals,
+        permutations are combined by order crossover and rotation bits by uniform crossover.
+        A child is then mutated with probability ga_mutation_rate (swap of two units or reversal of a segment),
+        and each of its rotation bits is flipped with probability ga_rotation_rate.
+        """
+        population_size, length = orders.shape
+        rank = np.empty(population_size, dtype=np.int64)
+        rank[ranking] = np.arange(population_size)
+
+        # The winner of a tournament is the contender with the best rank
+        contenders = self.rng.integers(population_size, size=(count, 2, max(1, self.ga_tournament)))
+        parents = np.take_along_axis(contenders, rank[contenders].argmin(axis=2)[..., None], axis=2)[..., 0]
+
+        child_orders = np.empty((count, length), dtype=orders.dtype)
+        for c, (a, b) in enumerate(parents.tolist()):
+            # Order crossover: a segment of the first parent, the other units in the order of the second parent
+            i, j = np.sort(self.rng.integers(length + 1, size=2))
+            segment = orders[a, i:j]
+            rest = orders[b][~np.isin(orders[b], segment)]
+            child = np.concatenate([rest[:i], segment, rest[i:]])
+            if self.rng.random() < self.ga_mutation_rate:
+                i, j = np.sort(self.rng.integers(length, size=2))
+                if self.rng.random() < 0.5:
+                    child[i], child[j] = child[j], child[i]
+                else:
+                    child[i : j + 1] = child[i : j + 1][::-1]
+            child_orders[c] = child
+
+        child_rotations = np.where(
+            self.rng.random((count, length)) < 0.5, rotations[parents[:, 0]], rotations[parents[:, 1]]
+        )
+        child_rotations ^= self.rng.random((count, length)) < self.ga_rotation_rate
+        return child_orders, child_rotations
+
+    def _decode_batch_(self, units, stocks, stock_states, orders, rotations, shm=None):
+        # Decode in this process, or split the population between the workers when the stocks are in shm
+        if shm is None:
+            return self._decode_population_(units, stocks, orders, rotations, stock_states)
+        shape = (len(stocks),) + stocks[0].shape
+        futures = [
+            self._pool.submit(_genetic_worker, shm.name, shape, stocks[0].dtype, units, chunk_orders, chunk_rotations)
+            for chunk_orders, chunk_rotations in zip(
+                np.array_split(orders, self.workers), np.array_split(rotations, self.workers)
+            )
+            if len(chunk_orders) > 0
+        ]
+        return np.concatenate([future.result() for future in futures])
+
+    def _decode_population_(self, units, stocks, orders, rotations, stock_states=None, layouts=None, deadline=None):
+        """
+        Bottom-left decoding of a batch of chromosomes on copies of the placement indexes of the stocks.
+        Returns an int array of shape (individuals, units, 5) with one (stock_idx, x, y, width, height) row
+        per unit, in the order they are cut, and stock_idx -1 for the units that could not be placed.
+        With a deadline (time.time() value), the decoding of a chromosome stops when it passes, once one unit
+        is placed, and the units it did not reach get stock_idx -2. Passing such layouts back decodes only
+        those units, around the cuts already in the layout.
+        """
+        if stock_states is not None:
+            sizes = [state.size for state in stock_states]
+            free_area = np.array([state.free_area for state in stock_states], dtype=np.int64)
+        else:
+            sizes = [self._get_stock_size_(stock) for stock in stocks]
+            free_area = np.array([np.count_nonzero(stock == -1) for stock in stocks], dtype=np.int64)
+        widths = np.array([size[0] for size in sizes], dtype=np.int64)
+        heights = np.array([size[1] for size in sizes], dtype=np.int64)
+        sizes = [(int(stock_w), int(stock_h)) for stock_w, stock_h in sizes]
+
+        unit_sizes = units.tolist()
+
+        # Stocks large enough for each product size, in either orientation
+        sized = {}
+        for width, height in set(map(tuple, unit_sizes)):
+            sized[width, height] = sized[height, width] = (
+                ((widths >= width) & (heights >= height)) | ((widths >= height) & (heights >= width))
+            )
+
+        def index_of(stock_idx):
+            # Copy of the placement index of a stock, made the first time the chromosome reaches it
+            index = indexes.get(stock_idx)
+            if index is None:
+                if stock_states is not None:
+                    index = stock_states[stock_idx].index.copy()
+                else:
+                    index = PlacementIndex(stocks[stock_idx])
+                indexes[stock_idx] = index
+            return index
+
+        if layouts is None:
+            layouts = np.full((len(orders), len(units), 5), -1, dtype=np.int64)
+            layouts[..., 0] = -2
+        else:
+            layouts = layouts.copy()
+        for b, (order, rotation) in enumerate(zip(orders.tolist(), rotations.tolist())):
+            indexes = {}
+            free = free_area.copy()
+            for stock_idx, x, y, w, h in layouts[b][layouts[b, :, 0] >= 0].tolist():
+                index_of(stock_idx).mark((x, y), (w, h))
+                free[stock_idx] -= w * h
+            placed = len(indexes) > 0
+            # Sizes that did not fit a stock, which can only fill up
+            failed = [set() for _ in stocks]
+            for k in np.flatnonzero(layouts[b, :, 0] == -2).tolist():
+                unit = order[k]
+                width, height = unit_sizes[unit]
+                if rotation[unit]:
+                    width, height = height, width
+                area = width * height
+                layouts[b, k, 0] = -1
+                for stock_idx in np.flatnonzero(sized[width, height] & (free >= area)).tolist():
+                    # A unit that is tried on many stocks can take long, so the deadline is checked per stock
+                    if deadline is not None and placed and time.time() >= deadline:
+                        layouts[b, k, 0] = -2
+                        break
+                    stock_w, stock_h = sizes[stock_idx]
+                    position = None
+                    for w, h in [(width, height), (height, width)][: 1 if width == height else 2]:
+                        if w > stock_w or h > stock_h or (w, h) in failed[stock_idx]:
+                            continue
+                        index = index_of(stock_idx)
+                        position = index.first_fit((w, h))
+                        if position is not None:
+                            break
+                        failed[stock_idx].add((w, h))
+                    if position is not None:
+                        index.mark(position, (w, h))
+                        free[stock_idx] -= area
+                        layouts[b, k] = (stock_idx, position[0], position[1], w, h)
                         placed = True
-        return solution
\ No newline at end of file
+                        break
+                if layouts[b, k, 0] == -2:
+                    break
+        return layouts
+
+    def _population_fitness_(self, units, stock_states, layouts):
+        """
+        Fitness of a batch of decoded layouts, computed for all of them at once.
+        Returns a float array of shape (individuals, 3) with the area of the units left unplaced, the number
+        of stocks used and the trim loss (mean free fraction of the stocks used, as the environment reports it),
+        to be minimized in this order.
+        """
+        stock_area = np.array([state.size[0] * state.size[1] for state in stock_states], dtype=np.int64)
+        free_area = np.array([state.free_area for state in stock_states], dtype=np.int64)
+
+        placed = layouts[..., 0] >= 0
+        areas = np.where(placed, layouts[..., 3] * layouts[..., 4], 0)
+        filled = np.zeros((len(layouts), len(stock_states)), dtype=np.int64)
+        rows = np.broadcast_to(np.arange(len(layouts))[:, None], placed.shape)
+        np.add.at(filled, (rows[placed], layouts[..., 0][placed]), areas[placed])
+
+        # Stocks cut before this order count as used too, like in the environment
+        used = (filled > 0) | (free_area < stock_area)
+        stocks_used = used.sum(axis=1)
+        left = np.where(used, (free_area - filled) / np.maximum(stock_area, 1), 0.0)
+        trim_loss = np.where(stocks_used > 0, left.sum(axis=1) / np.maximum(stocks_used, 1), 1.0)
+        unplaced_area = (units[:, 0] * units[:, 1]).sum() - areas.sum(axis=1)
+        return np.stack([unplaced_area, stocks_used, trim_loss], axis=1).astype(float)
+
+    ##################################
+    #Helping functions for Column Generation
+    def column_generation(self, products, stock_states):
+        """
+        Gilmore-Gomory column generation over the empty stocks.
+        The master LP chooses how many times each cutting pattern is used, with the stock area as cost
+        and at most the number of empty stocks of each size. New patterns come from a two-stage
+        (shelf) knapsack priced with the LP duals, until no pattern has a negative reduced cost.
+        Returns the actions of the LP solution rounded down, see solve_info for the LP bound and the rounding used.
+        """
+        start = time.time()
+
+        # Products with the same size are the same item for the environment
+        demand_by_size = {}
+        for prod in products:
+            if prod["quantity"] > 0:
+                size = tuple(sorted((int(prod["size"][0]), int(prod["size"][1]))))
+                demand_by_size[size] = demand_by_size.get(size, 0) + int(prod["quantity"])
+        item_sizes = list(demand_by_size)
+        demand = np.array([demand_by_size[size] for size in item_sizes])
+
+        # Stock types: the empty stocks grouped by size
+        stocks_by_type = {}
+        for stock_idx, state in enumerate(stock_states):
+            stock_w, stock_h = state.size
+            if stock_w > 0 and stock_h > 0 and state.free_area == stock_w * stock_h:
+                stocks_by_type.setdefault((stock_w, stock_h), []).append(stock_idx)
+        type_sizes = list(stocks_by_type)
+        if not item_sizes or not type_sizes:
+            self.solve_info = {"time": time.time() - start, "iterations": 0, "patterns": 0, "lp_objective": None, "stocks": 0}
+            return []
+        type_counts = np.array([len(stocks_by_type[size]) for size in type_sizes])
+        type_costs = np.array([stock_w * stock_h for stock_w, stock_h in type_sizes], dtype=float)
+
+        # A pattern is (stock type, item counts, layout), the layout is a list of (x, y, width, height, item)
+        patterns = []
+        seen = set()
+
+        def add_pattern(type_idx, layout):
+            counts = np.bincount([item for *_, item in layout], minlength=len(item_sizes))
+            key = (type_idx, tuple(counts))
+            if counts.sum() == 0 or key in seen:
+                return False
+            seen.add(key)
+            patterns.append((type_idx, counts, layout))
+            return True
+
+        # Initial patterns: every item alone on every stock type, which keeps the first LP feasible when possible
+        for type_idx, stock_size in enumerate(type_sizes):
+            for item, item_size in enumerate(item_sizes):
+                add_pattern(type_idx, self._homogeneous_pattern_(stock_size, item_size, item, demand[item]))
+
+        result = None
+        iteration = 0
+        while iteration < self.cg_max_iterations and time.time() - start < self.cg_time_limit:
+            iteration += 1
+            result = self._solve_master_(patterns, demand, type_counts, type_costs)
+            if result.status != 0:
+                break
+
+            # Duals of the demand rows (>= 0) and of the stock availability rows (<= 0)
+            marginals = result.ineqlin.marginals
+            item_values = -marginals[: len(item_sizes)]
+            type_duals = marginals[len(item_sizes):]
+
+            added = 0
+            for type_idx, layout in self._price_patterns_(item_sizes, item_values, demand, type_sizes):
+                value = sum(item_values[item] for *_, item in layout)
+                if type_costs[type_idx] - value - type_duals[type_idx] < -1e-6 and add_pattern(type_idx, layout):
+                    added += 1
+            if added == 0:
+                break
+
+        self.solve_info = {"time": time.time() - start, "iterations": iteration, "patterns": len(patterns)}
+        if result is None or result.status != 0:
+            # Not enough empty stocks for the whole order, First Fit Decreasing does all the work
+            self.solve_info.update({"lp_objective": None, "stocks": 0})
+            return []
+        self.solve_info.update({"lp_objective": float(result.fun), "lp_stocks": float(result.x.sum())})
+
+        # Rounding: every pattern is cut floor(x) times, in decreasing order of x, without more copies of an
+        # item than the remaining demand (items already covered are left out of the layouts). The products that
+        # are left go to the gaps of the used stocks in make_plan.
+        free_stocks = [list(stocks_by_type[size]) for size in type_sizes]
+        remaining = demand.copy()
+        actions = []
+        used_stocks = 0
+        for p in np.argsort(-result.x, kind="stable"):
+            type_idx, pattern_counts, layout = patterns[p]
+            for _ in range(int(np.floor(result.x[p] + 1e-9))):
+                if not free_stocks[type_idx] or not np.any(np.minimum(pattern_counts, remaining) > 0):
+                    break
+                used_stocks += 1
+                actions.extend(self._cut_pattern_(free_stocks[type_idx].pop(0), layout, remaining))
+        rounding = "lp_floor"
+
+        # Fallback when the LP solution is too fractional for any pattern to be cut once (many product sizes
+        # with small demand): greedily take the generated pattern that fills its stock best with the remaining
+        # demand, while it fills at least min_fill of the stock
+        if used_stocks == 0:
+            rounding = "fill"
+            counts = np.array([pattern_counts for type_idx, pattern_counts, layout in patterns])
+            pattern_types = np.array([type_idx for type_idx, pattern_counts, layout in patterns])
+            item_areas = np.array([a * b for a, b in item_sizes])
+            while np.any(remaining > 0):
+                available = np.array([len(stock_list) > 0 for stock_list in free_stocks])[pattern_types]
+                fill = np.minimum(counts, remaining) @ item_areas / type_costs[pattern_types]
+                fill[~available] = 0
+                p = int(np.argmax(fill))
+                if fill[p] < self.cg_min_fill:
+                    break
+                type_idx, pattern_counts, layout = patterns[p]
+                used_stocks += 1
+                actions.extend(self._cut_pattern_(free_stocks[type_idx].pop(0), layout, remaining))
+
+        self.solve_info.update({"time": time.time() - start, "rounding": rounding, "stocks": used_stocks})
+        return actions
+
+    def _cut_pattern_(self, stock_idx, layout, remaining):
+        # Actions of a pattern on a stock, leaving out the items whose remaining demand is already covered
+        actions = []
+        for x, y, width, height, item in layout:
+            if remaining[item] > 0:
+                remaining[item] -= 1
+                actions.append({"stock_idx": stock_idx, "size": (width, height), "position": (x, y)})
+        return actions
+
+    def _solve_master_(self, patterns, demand, type_counts, type_costs):
+        # min cost . x  s.t.  -counts . x <= -demand  and  sum of the patterns of each type <= type_counts
+        n_items = len(demand)
+        A = np.zeros((n_items + len(type_counts), len(patterns)))
+        costs = np.zeros(len(patterns))
+        for p, (type_idx, counts, layout) in enumerate(patterns):
+            A[:n_items, p] = -counts
+            A[n_items + type_idx, p] = 1
+            costs[p] = type_costs[type_idx]
+        b = np.concatenate([-demand, type_counts]).astype(float)
+        return linprog(costs, A_ub=A, b_ub=b, bounds=(0, None), method="highs")
+
+    def _homogeneous_pattern_(self, stock_size, item_size, item, demand):
+        # Grid of one item in its better orientation, at most demand copies
+        stock_w, stock_h = stock_size
+        best = []
+        for width, height in (item_size, item_size[::-1]):
+            if width > stock_w or height > stock_h:
+                continue
+            layout = [
+                (x, y, width, height, item)
+                for x in range(0, stock_w - width + 1, width)
+                for y in range(0, stock_h - height + 1, height)
+            ][:demand]
+            if len(layout) > len(best):
+                best = layout
+        return best
+
+    def _price_patterns_(self, item_sizes, item_values, demand, type_sizes):
+        """
+        Pricing subproblem: for every stock type, a two-stage pattern of shelves.
+        A shelf spans the whole stock width (x axis) and holds items side by side, so the best shelf of each height
+        is a bounded knapsack over the width. One knapsack per shelf height gives the best shelf for every
+        width at once, then a second knapsack over the height stacks the shelves of each stock type.
+        Yields (type index, layout) pairs.
+        """
+        max_w = max(stock_w for stock_w, stock_h in type_sizes)
+        max_h = max(stock_h for stock_w, stock_h in type_sizes)
+        heights = sorted({side for size in item_sizes for side in size if side <= max_h})
+
+        shelves = {}
+        for shelf_h in heights:
+            items = []
+            for item, (a, b) in enumerate(item_sizes):
+                if item_values[item] <= 1e-9:
+                    continue
+                # Narrowest orientation that fits under the shelf height
+                widths = [width for width, height in ((a, b), (b, a)) if height <= shelf_h]
+                if not widths or min(widths) > max_w:
+                    continue
+                width = min(widths)
+                items.append((width, item_values[item], min(int(demand[item]), max_w // width), (item, width, a + b - width)))
+            shelves[shelf_h] = self._bounded_knapsack_(max_w, items)
+
+        for type_idx, (stock_w, stock_h) in enumerate(type_sizes):
+            shelf_items = []
+            for shelf_h in heights:
+                best, copies, takes = shelves[shelf_h]
+                if shelf_h <= stock_h and best[stock_w] > 1e-9:
+                    # A shelf is not repeated more often than the demand of its items allows
+                    repeats = stock_h // shelf_h
+                    for (item, width, height), count in self._knapsack_choice_(copies, takes, stock_w):
+                        repeats = min(repeats, max(1, int(demand[item]) // count))
+                    shelf_items.append((shelf_h, best[stock_w], repeats, shelf_h))
+            if not shelf_items:
+                continue
+            best, copies, takes = self._bounded_knapsack_(stock_h, shelf_items)
+
+            # Build the layout shelf by shelf, without more copies of an item than the demand
+            remaining = demand.copy()
+            layout = []
+            y = 0
+            for shelf_h, n_shelves in self._knapsack_choice_(copies, takes, stock_h):
+                for _ in range(n_shelves):
+                    x = 0
+                    for (item, width, height), count in self._knapsack_choice_(*shelves[shelf_h][1:], stock_w):
+                        for _ in range(count):
+                            if remaining[item] > 0:
+                                remaining[item] -= 1
+                                layout.append((x, y, width, height, item))
+                                x += width
+                    y += shelf_h
+            yield type_idx, layout
+
+    def _bounded_knapsack_(self, capacity, items):
+        """
+        Bounded knapsack for every capacity 0..capacity at once, items are (weight, value, bound, payload).
+        Each item is split into power-of-two copies, and each copy is one vectorized 0/1 update of the table.
+        Returns the best values, the copies (payload, count) and for each copy the capacities where it was taken.
+        """
+        best = np.zeros(capacity + 1)
+        copies = []
+        takes = []
+        for weight, value, bound, payload in items:
+            step = 1
+            while bound > 0:
+                count = min(step, bound)
+                bound -= count
+                step *= 2
+                if count * weight <= capacity:
+                    candidate = best[: capacity + 1 - count * weight] + count * value
+                    take = np.zeros(capacity + 1, dtype=bool)
+                    take[count * weight:] = candidate > best[count * weight:] + 1e-12
+                    best[count * weight:] = np.maximum(best[count * weight:], candidate)
+                    copies.append((payload, count, weight))
+                    takes.append(take)
+        return best, copies, takes
+
+    def _knapsack_choice_(self, copies, takes, capacity):
+        # Walk the copies backwards to recover the (payload, count) choices of the best value at capacity
+        chosen = []
+        for (payload, count, weight), take in zip(reversed(copies), reversed(takes)):
+            if take[capacity]:
+                chosen.append((payload, count))
+                capacity -= count * weight
+        return chosen
+
+    ##################################
+    #Helping functions for batch planning
+    def make_plan(self, observation):
+        """
+        Cutting plan of the whole order, from the plan cache when the same order was already planned
+        with the same parameters. Each entry is (action, products after the action), where the products
+        are stored as (width, height, quantity) tuples to check that the env followed the plan.
+        """
+        key = PlanCache.key(observation["stocks"], observation["products"], self._plan_params_())
+        cached = self.plan_cache.get(key)
+        if cached is not None:
+            return [
+                ({"stock_idx": stock_idx, "size": tuple(size), "position": tuple(position)}, tuple(map(tuple, products)))
+                for stock_idx, size, position, products in cached
+            ]
+
+        plan = self._compute_plan_(observation)
+        self.plan_cache.put(
+            key,
+            [
+                [int(action["stock_idx"]), [int(v) for v in action["size"]], [int(v) for v in action["position"]], products]
+                for action, products in plan
+            ],
+        )
+        return plan
+
+    def _plan_params_(self):
+        # Parameters that change the plan of an order, part of the plan cache key.
+        # The seed is not: a stored plan is reused whatever the generator state.
+        return {
+            "policy_id": self.policy_id,
+            "initial_temperature": self.initial_temperature,
+            "cooling_rate": self.cooling_rate,
+            "max_iterations": self.max_iterations,
+            "restarts": self.restarts,
+            "cg_max_iterations": self.cg_max_iterations,
+            "cg_min_fill": self.cg_min_fill,
+            "ga_population": self.ga_population,
+            "ga_generations": self.ga_generations,
+            "ga_elite": self.ga_elite,
+            "ga_tournament": self.ga_tournament,
+            "ga_mutation_rate": self.ga_mutation_rate,
+            "ga_rotation_rate": self.ga_rotation_rate,
+        }
+
+    def _compute_plan_(self, observation):
+        """
+        Compute the cutting plan of the whole order.
+        The plan of Column Generation is compared with the First Fit Decreasing plan of the same order,
+        the comparison is stored in solve_info and the better plan is kept.
+        """
+        plan, stocks, products = self._simulate_plan_(observation, self.policy_id)
+        if self.policy_id == 3:
+            ffd_plan, ffd_stocks, ffd_products = self._simulate_plan_(observation, 1)
+            quality = self._plan_quality_(stocks, products)
+            ffd_quality = self._plan_quality_(ffd_stocks, ffd_products)
+            self.solve_info.update({
+                "plan_stocks": quality[1],
+                "plan_trim_loss": quality[2],
+                "ffd_stocks": ffd_quality[1],
+                "ffd_trim_loss": ffd_quality[2],
+                "chosen": "ffd" if ffd_quality < quality else "cg",
+            })
+            if ffd_quality < quality:
+                plan = ffd_plan
+        return plan
+
+    def _simulate_plan_(self, observation, policy_id):
+        # Plan of the order with the algorithm of policy_id, simulated on copies of the stocks and products.
+        # Returns the plan and the simulated stocks and products after it.
+        stocks = [np.copy(stock) for stock in observation["stocks"]]
+        products = [{"size": np.copy(prod["size"]), "quantity": int(prod["quantity"])} for prod in observation["products"]]
+        stock_states = [StockState(stock) for stock in stocks]
+        stock_index = StockIndex(stock_states)
+
+        plan = []
+        
+        # Column Generation cuts the empty stocks with the patterns of the rounded LP solution first,
+        # the products that are left are cut by First Fit Decreasing below, in the stocks it already uses first
+        stock_order = None
+        if policy_id == 3:
+            for action in self.column_generation(products, stock_states):
+                self._apply_action_(action, products, stocks, stock_states, stock_index)
+                plan.append((action, self._products_key_(products)))
+            used = list(dict.fromkeys(action["stock_idx"] for action, _ in plan))
+            stock_order = used + sorted(set(range(len(stocks))) - set(used))
+
+        # The Genetic Algorithm cuts the best layout it found, the products it could not place are cut
+        # by First Fit Decreasing below
+        if policy_id == 4:
+            for action in self.genetic_algorithm(products, stocks, stock_states):
+                if self._is_valid_action_(action, products, stocks, stock_states):
+                    self._apply_action_(action, products, stocks, stock_states, stock_index)
+                    plan.append((action, self._products_key_(products)))
+
+        while any(prod["quantity"] > 0 for prod in products):
+            # Simulated annealing places up to one unit of every product type per run:
+            # keep every cut of the best solution that is still valid on the simulated stocks
+            if policy_id == 2:
+                placed = 0
+                for stock_idx, x, y, width, height, rotated in self.simulated_annealing(products, stocks) or []:
+                    action = {"stock_idx": stock_idx, "size": (width, height), "position": (x, y)}
+                    if self._is_valid_action_(action, products, stocks, stock_states):
+                        self._apply_action_(action, products, stocks, stock_states, stock_index)
+                        plan.append((action, self._products_key_(products)))
+                        placed += 1
+                if placed > 0:
+                    continue
+
+            # First Fit Decreasing, also used when the annealing found nothing valid this round
+            action = self._first_fit_decreasing_(products, stocks, stock_states, stock_order, stock_index)
+            if action is None:
+                break
+            self._apply_action_(action, products, stocks, stock_states, stock_index)
+            plan.append((action, self._products_key_(products)))
+        return plan, stocks, products
+
+    def _plan_quality_(self, stocks, products):
+        # (units left, stocks used, trim loss) of simulated stocks, trim loss as the environment computes it
+        used = [stock for stock in stocks if np.any(stock >= 0)]
+        trim_loss = float(np.mean([np.sum(stock == -1) / np.sum(stock != -2) for stock in used])) if used else 1.0
+        return (sum(int(prod["quantity"]) for prod in products), len(used), trim_loss)
+
+    def _find_product_(self, products, size):
+        # Same rule as the environment: the first product of that size (in any orientation) with quantity > 0
+        width, height = int(size[0]), int(size[1])
+        for prod_idx, prod in enumerate(products):
+            prod_w, prod_h = int(prod["size"][0]), int(prod["size"][1])
+            if prod["quantity"] > 0 and ((prod_w, prod_h) == (width, height) or (prod_h, prod_w) == (width, height)):
+                return prod_idx
+        return None
+
+    def _is_valid_action_(self, action, products, stocks, stock_states):
+        stock_idx = action["stock_idx"]
+        x, y = action["position"]
+        width, height = action["size"]
+        stock_w, stock_h = stock_states[stock_idx].size
+        if x < 0 or y < 0 or x + width > stock_w or y + height > stock_h:
+            return False
+        return self._find_product_(products, (width, height)) is not None and self._can_place_(stocks[stock_idx], (x, y), (width, height))
+
+    def _apply_action_(self, action, products, stocks, stock_states, stock_index=None):
+        # Simulate env.step on the copies of the stocks and products (and their stock index, if given)
+        stock_idx = action["stock_idx"]
+        x, y = action["position"]
+        width, height = int(action["size"][0]), int(action["size"][1])
+        prod_idx = self._find_product_(products, (width, height))
+        stocks[stock_idx][x:x + width, y:y + height] = prod_idx
+        stock_states[stock_idx].place((x, y), (width, height))
+        if stock_index is not None:
+            stock_index.update(stock_idx)
+        products[prod_idx]["quantity"] -= 1
+
+    def _products_key_(self, products):
+        return tuple((int(prod["size"][0]), int(prod["size"][1]), int(prod["quantity"])) for prod in products)
+
+    def _plan_matches_(self, observation):
+        # The observation must be the one the plan predicted after the last replayed action
+        if self._plan_expected is None:
+            return False
+        action, expected_products = self._plan_expected
+        if self._products_key_(observation["products"]) != expected_products:
+            return False
+        x, y = action["position"]
+        width, height = int(action["size"][0]), int(action["size"][1])
+        return not np.any(observation["stocks"][action["stock_idx"]][x:x + width, y:y + height] == -1)
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules of the repository are imported from its root, as main.py and benchmark.py do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_random_stock(rng, shape=(14, 11), min_size=4, max_cuts=4, max_cut=4):
+    # Free cells (-1) in a random size of at least min_size, -2 outside, and up to max_cuts cuts
+    # of at most max_cut cells per side, clipped to the stock
+    stock = np.full(shape, -2, dtype=int)
+    stock_w, stock_h = rng.integers(min_size, shape[0] + 1), rng.integers(min_size, shape[1] + 1)
+    stock[:stock_w, :stock_h] = -1
+    for prod_idx in range(int(rng.integers(0, max_cuts + 1))):
+        x, y = rng.integers(0, stock_w), rng.integers(0, stock_h)
+        stock[x : min(stock_w, x + rng.integers(1, max_cut + 1)), y : min(stock_h, y + rng.integers(1, max_cut + 1))] = prod_idx
+    return stock
+
+
+@pytest.fixture
+def random_stock():
+    return make_random_stock
+
+
+def make_random_order(seed, max_quantity=4):
+    # Four 30x30 grids holding stocks of random size with a few cuts, and five products
+    rng = np.random.default_rng(seed)
+    stocks = [make_random_stock(rng, shape=(30, 30), min_size=15, max_cuts=3, max_cut=6) for _ in range(4)]
+    products = [
+        {"size": np.array([int(w), int(h)]), "quantity": int(q)}
+        for w, h, q in zip(rng.integers(2, 9, size=5), rng.integers(2, 9, size=5), rng.integers(1, max_quantity + 1, size=5))
+    ]
+    return stocks, products
+
+
+def play_order(policy, stocks, products, steps=8):
+    # Cut the actions of the policy like the environment does (the first product of the size in any
+    # orientation), on copies of the order, and return them
+    stocks = [stock.copy() for stock in stocks]
+    products = [dict(prod) for prod in products]
+    trace = []
+    for _ in range(steps):
+        action = policy.get_action({"stocks": tuple(stocks), "products": tuple(products)}, {})
+        stock_idx, (width, height), (x, y) = int(action["stock_idx"]), map(int, action["size"]), map(int, action["position"])
+        trace.append((stock_idx, width, height, x, y))
+        matches = [
+            i for i, prod in enumerate(products)
+            if prod["quantity"] > 0 and tuple(prod["size"]) in [(width, height), (height, width)]
+        ]
+        region = stocks[stock_idx][x : x + width, y : y + height]
+        if not matches or width == 0 or region.shape != (width, height) or np.any(region != -1):
+            break
+        region[...] = matches[0]
+        products[matches[0]]["quantity"] -= 1
+    return trace
+
+
+@pytest.fixture
+def random_order():
+    return make_random_order
+
+
+@pytest.fixture
+def play():
+    return play_order
@@ -0,0 +1,48 @@
+"""
+Seeded simulated annealing must give the same actions whether its chains run in this process or on the pool.
+"""
+import numpy as np
+
+from student_submissions.s2210xxx.policy2210xxx import Policy2312900_2310559_2420003_2312894_2312974
+
+
+def test_pooled_chains_match_serial_trace(random_order, play):
+    for seed in range(3):
+        stocks, products = random_order(seed)
+        serial = Policy2312900_2310559_2420003_2312894_2312974(policy_id=2, workers=1, seed=seed)
+        pooled = Policy2312900_2310559_2420003_2312894_2312974(policy_id=2, workers=2, seed=seed)
+        try:
+            assert play(pooled, stocks, products) == play(serial, stocks, products)
+        finally:
+            pooled.close()
+
+
+def test_pooled_chains_come_back_in_seed_order(random_order):
+    stocks, products = random_order(0)
+    policy = Policy2312900_2310559_2420003_2312894_2312974(policy_id=2, workers=2, seed=0)
+    seeds = [11, 12, 13, 14]
+    try:
+        pooled = policy._parallel_chains_(products, stocks, seeds, None)
+    finally:
+        policy.close()
+
+    serial = []
+    for seed in seeds:
+        policy.seed(seed)
+        serial.append(policy._anneal_chain_(products, stocks))
+    assert pooled == serial
+
+
+def test_decoding_resumes_after_the_deadline(random_order):
+    # A decoding stopped by a deadline that has passed places one unit, and decoding the rest of the layout
+    # afterwards gives the layout of a decoding without deadline
+    stocks, products = random_order(1)
+    policy = Policy2312900_2310559_2420003_2312894_2312974(policy_id=2, seed=0)
+    units = policy._order_units_(products)
+    orders, rotations = policy._initial_population_(units, 3)
+    full = policy._decode_population_(units, stocks, orders, rotations)
+
+    partial = policy._decode_population_(units, stocks, orders, rotations, deadline=0.0)
+    assert ((partial[:, :, 0] >= 0).sum(axis=1) == 1).all()
+    assert (partial[:, 1:, 0] == -2).all()
+    assert np.array_equal(policy._decode_population_(units, stocks, orders, rotations, layouts=partial), full)
@@ -0,0 +1,85 @@
+"""
+SolutionEvaluator must give the fitness of evaluate_solution after reset, after every neighbor move
+and after undoing a move, with cuts covering stock[x:x+width, y:y+height].
+"""
+import numpy as np
+import pytest
+
+from policy import StockBitset
+from student_submissions.s2210xxx.policy2210xxx import (
+    Policy2312900_2310559_2420003_2312894_2312974,
+    SolutionEvaluator,
+)
+
+
+def make_policy(seed=0):
+    return Policy2312900_2310559_2420003_2312894_2312974(policy_id=2, seed=seed)
+
+
+def random_stocks(random_stock, rng, count=3):
+    # Stocks of random size in a 20x20 grid, with a few cuts already in them
+    return [random_stock(rng, shape=(20, 20), min_size=8, max_cuts=3, max_cut=3) for _ in range(count)]
+
+
+def random_cut(rng, stocks):
+    # Cuts may overlap each other and go past the stock, like the cuts of generate_neighbor before clipping
+    width, height = int(rng.integers(1, 8)), int(rng.integers(1, 8))
+    return (
+        int(rng.integers(len(stocks))),
+        int(rng.integers(0, 22)),
+        int(rng.integers(0, 22)),
+        width,
+        height,
+        bool(rng.integers(2)),
+    )
+
+
+def test_reset_matches_evaluate_solution(random_stock):
+    rng = np.random.default_rng(0)
+    policy = make_policy()
+    for _ in range(200):
+        stocks = random_stocks(random_stock, rng)
+        solution = [random_cut(rng, stocks) for _ in range(int(rng.integers(0, 12)))]
+        expected = policy.evaluate_solution(solution, stocks)
+        assert SolutionEvaluator(stocks).reset(solution) == expected
+        assert policy.evaluate_solution(solution, [StockBitset.from_stock(stock) for stock in stocks]) == expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_moves_and_undos_match_evaluate_solution(seed, random_stock):
+    rng = np.random.default_rng(seed)
+    policy = make_policy(seed)
+    stocks = random_stocks(random_stock, rng)
+    current = [random_cut(rng, stocks) for _ in range(10)]
+    evaluator = SolutionEvaluator(stocks)
+    assert evaluator.reset(current) == policy.evaluate_solution(current, stocks)
+
+    for _ in range(30):
+        if rng.random() < 0.5:
+            neighbor = policy.generate_neighbor(current, [], stocks)
+        else:
+            neighbor = list(current)
+            for k in rng.choice(len(neighbor), size=int(rng.integers(1, 4)), replace=False):
+                neighbor[k] = random_cut(rng, stocks)
+        changed = [k for k, (old, new) in enumerate(zip(current, neighbor)) if old != new]
+
+        assert evaluator.update(neighbor, changed) == policy.evaluate_solution(neighbor, stocks)
+        if rng.random() < 0.5:
+            current = neighbor
+        else:
+            # Undo, as _anneal_chain_ does for a rejected neighbor
+            assert evaluator.update(current, changed) == policy.evaluate_solution(current, stocks)
+
+
+def test_cuts_index_x_then_y():
+    # stock[0:2, 3:6] is cut. With [y:y+height, x:x+width] indexing both answers below would be swapped.
+    stock = np.full((10, 6), -1, dtype=int)
+    stock[0:2, 3:6] = 0
+    policy = make_policy()
+
+    free_cut = [(0, 3, 0, 2, 2, False)]  # stock[3:5, 0:2] is free
+    taken_cut = [(0, 0, 3, 2, 2, False)]  # stock[0:2, 3:5] is cut
+    assert policy.evaluate_solution(free_cut, [stock]) == 0
+    assert policy.evaluate_solution(taken_cut, [stock]) == -4
+    assert SolutionEvaluator([stock]).reset(free_cut) == 0
+    assert SolutionEvaluator([stock]).reset(taken_cut) == -4
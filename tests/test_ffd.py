@@ -0,0 +1,33 @@
+"""
+First Fit Decreasing must cut the same products at the same places with and without pattern reuse.
+"""
+import numpy as np
+
+from student_submissions.s2210xxx.policy2210xxx import Policy2312900_2310559_2420003_2312894_2312974
+
+
+def make_policy(reuse_patterns):
+    policy = Policy2312900_2310559_2420003_2312894_2312974(policy_id=1)
+    policy.reuse_patterns = reuse_patterns
+    policy.enable_profiling()
+    return policy
+
+
+def test_pattern_reuse_keeps_the_trace(random_order, play):
+    searches = {True: 0, False: 0}
+    for seed in range(10):
+        stocks, products = random_order(seed, max_quantity=12)
+        # Products of the same size, also rotated, and of the same area next to each other in the order
+        products += [
+            {"size": np.array([3, 5]), "quantity": 6},
+            {"size": np.array([5, 3]), "quantity": 4},
+            {"size": np.array([15, 1]), "quantity": 2},
+            {"size": np.array([3, 5]), "quantity": 5},
+        ]
+        traces = {}
+        for reuse_patterns in [True, False]:
+            policy = make_policy(reuse_patterns)
+            traces[reuse_patterns] = play(policy, stocks, products, steps=200)
+            searches[reuse_patterns] += policy.profile_stats()["_first_fit_decreasing_"]["calls"]
+        assert traces[True] == traces[False]
+    assert searches[True] < searches[False]
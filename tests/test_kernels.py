@@ -0,0 +1,119 @@
+"""
+Both paths of kernels.py (numpy and loops, compiled when numba is installed) against reference implementations.
+The private implementations are called directly, so the numpy path is covered even when numba is installed.
+"""
+import numpy as np
+import pytest
+
+import kernels
+from policy import PlacementIndex
+
+FIRST_FIT = [kernels._first_fit_numpy, kernels._first_fit_loop]
+RECT_FREE = [kernels._rect_free_numpy, kernels._rect_free_loop]
+OVERLAP_WASTE = [kernels._overlap_waste_numpy, kernels._overlap_waste_loop]
+if kernels.BACKEND == "numba":
+    FIRST_FIT.append(kernels._first_fit_kernel)
+    RECT_FREE.append(kernels._rect_free_kernel)
+    OVERLAP_WASTE.append(kernels._overlap_waste_kernel)
+
+
+def reference_first_fit(stock, prod_w, prod_h):
+    # Nested x/y scan of the grid
+    if prod_w <= 0 or prod_h <= 0:
+        return -1, -1
+    for x in range(stock.shape[0] - prod_w + 1):
+        for y in range(stock.shape[1] - prod_h + 1):
+            if np.all(stock[x : x + prod_w, y : y + prod_h] == -1):
+                return x, y
+    return -1, -1
+
+
+def reference_overlap_waste(free, cuts):
+    # Cuts accepted in order on copies of the free masks
+    waste = []
+    for solution in cuts:
+        used = free.copy()
+        total = 0
+        for slot, x0, y0, x1, y1, area in solution.tolist():
+            region = used[slot, x0:x1, y0:y1]
+            if region.all():
+                region[...] = False
+            else:
+                total += area
+        waste.append(total)
+    return np.array(waste)
+
+
+@pytest.mark.parametrize("first_fit", FIRST_FIT)
+def test_first_fit(first_fit, random_stock):
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        stock = random_stock(rng)
+        table = PlacementIndex(stock).table
+        for prod_w, prod_h in [(0, 3), (3, 0), (15, 1), (1, 12)] + [tuple(rng.integers(1, 8, size=2)) for _ in range(5)]:
+            expected = reference_first_fit(stock, int(prod_w), int(prod_h))
+            assert tuple(first_fit(table, int(prod_w), int(prod_h))) == expected
+
+
+def test_fit_mask_and_public_first_fit(random_stock):
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        stock = random_stock(rng)
+        table = PlacementIndex(stock).table
+        prod_w, prod_h = (int(v) for v in rng.integers(1, 8, size=2))
+        mask = kernels.fit_mask(table, prod_w, prod_h)
+        for x in range(mask.shape[0]):
+            for y in range(mask.shape[1]):
+                assert mask[x, y] == np.all(stock[x : x + prod_w, y : y + prod_h] == -1)
+        expected = reference_first_fit(stock, prod_w, prod_h)
+        assert kernels.first_fit(table, prod_w, prod_h) == (None if expected == (-1, -1) else expected)
+    assert kernels.fit_mask(table, 20, 1).shape == (0, 0)
+
+
+@pytest.mark.parametrize("rect_free", RECT_FREE)
+def test_rect_free(rect_free, random_stock):
+    rng = np.random.default_rng(2)
+    for _ in range(100):
+        stock = random_stock(rng)
+        for _ in range(10):
+            # Rectangles may go past the grid, both paths clip like the slice
+            x, y = (int(v) for v in rng.integers(0, 14, size=2))
+            prod_w, prod_h = (int(v) for v in rng.integers(1, 8, size=2))
+            expected = bool(np.all(stock[x : x + prod_w, y : y + prod_h] == -1))
+            assert bool(rect_free(stock, x, y, prod_w, prod_h)) == expected
+            assert kernels.rect_free(stock, x, y, prod_w, prod_h) == expected
+
+
+@pytest.mark.parametrize("overlap_waste", OVERLAP_WASTE)
+def test_overlap_waste(overlap_waste, random_stock):
+    rng = np.random.default_rng(3)
+    for _ in range(30):
+        free = np.stack([random_stock(rng) == -1 for _ in range(3)])
+        n_solutions, n_cuts = int(rng.integers(1, 8)), int(rng.integers(0, 10))
+        cuts = np.zeros((n_solutions, n_cuts, 6), dtype=np.int64)
+        for b in range(n_solutions):
+            for k in range(n_cuts):
+                slot, x0, y0 = int(rng.integers(3)), int(rng.integers(0, 14)), int(rng.integers(0, 11))
+                if k > 0 and rng.random() < 0.2:
+                    # Corner inside an earlier cut of the solution, for the empty cuts below
+                    slot, cut_x0, cut_y0, cut_x1, cut_y1, _ = cuts[b, rng.integers(k)].tolist()
+                    x0 = int(rng.integers(cut_x0, max(cut_x0, cut_x1 - 1) + 1))
+                    y0 = int(rng.integers(cut_y0, max(cut_y0, cut_y1 - 1) + 1))
+                # Some cuts are empty in x or in y, the others are clipped to the grid
+                x1 = x0 if rng.random() < 0.15 else min(14, x0 + int(rng.integers(1, 6)))
+                y1 = y0 if rng.random() < 0.15 else min(11, y0 + int(rng.integers(1, 6)))
+                cuts[b, k] = (slot, x0, y0, x1, y1, rng.integers(1, 30))
+        expected = reference_overlap_waste(free, cuts)
+        assert np.array_equal(overlap_waste(free, cuts), expected)
+        assert np.array_equal(kernels.overlap_waste(free, cuts), expected)
+
+
+@pytest.mark.parametrize("overlap_waste", OVERLAP_WASTE)
+def test_overlap_waste_empty_cuts_block_nothing(overlap_waste):
+    # An empty cut inside an accepted cut is accepted, and an accepted empty cut does not block a later cut
+    free = np.ones((1, 10, 10), dtype=bool)
+    inside = np.array([[[0, 3, 3, 7, 5, 8], [0, 5, 2, 5, 6, 4]]], dtype=np.int64)
+    before = np.array([[[0, 5, 2, 5, 6, 4], [0, 3, 3, 7, 5, 8]]], dtype=np.int64)
+    for cuts in [inside, before, inside[:, :, [0, 2, 1, 4, 3, 5]]]:
+        assert np.array_equal(reference_overlap_waste(free, cuts), [0])
+        assert np.array_equal(overlap_waste(free, cuts), [0])
@@ -0,0 +1,40 @@
+"""
+PhaseTimer must count the time a generator method spends while it is iterated, not only its creation.
+"""
+import time
+
+from policy import PhaseTimer
+
+
+class Slow:
+    def pairs(self, count):
+        for i in range(count):
+            time.sleep(0.01)
+            yield i
+
+    def total(self, count):
+        time.sleep(0.01 * count)
+        return count
+
+
+def test_generator_time_includes_iteration():
+    timer = PhaseTimer(Slow().pairs)
+    assert list(timer(3)) == [0, 1, 2]
+    stats = timer.stats()
+    assert stats["calls"] == 1
+    assert stats["total_s"] >= 0.03
+
+
+def test_generator_dropped_early_is_counted():
+    timer = PhaseTimer(Slow().pairs)
+    for i in timer(5):
+        break
+    assert timer.stats()["calls"] == 1
+    assert timer.stats()["total_s"] >= 0.01
+
+
+def test_plain_method():
+    timer = PhaseTimer(Slow().total)
+    assert timer(2) == 2
+    assert timer.stats()["calls"] == 1
+    assert timer.stats()["total_s"] >= 0.02